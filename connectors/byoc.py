@@ -6,9 +6,9 @@
 """
 Implementation of BYOC protocol.
 """
+import functools
+import json
 import socket
-from collections import UserDict
-from copy import deepcopy
 from datetime import datetime, timezone
 from enum import Enum
 
@@ -29,6 +29,28 @@ SYNC_DISABLED = -1
 JOB_NOT_FOUND_ERROR = "Couldn't find the job"
 UNKNOWN_ERROR = "unknown error"
 
+# _source fields read from connectors and sync jobs during a scheduler round
+CONNECTOR_SOURCE_FIELDS = [
+    "service_type",
+    "is_native",
+    "configuration",
+    "status",
+    "scheduling",
+    "sync_now",
+    "last_seen",
+    "last_sync_status",
+    "features",
+    "filtering",
+    "pipeline",
+    "index_name",
+    "language",
+]
+# idle jobs are reloaded before any other field is read
+SYNC_JOB_SOURCE_FIELDS = ["status", "connector.id", "last_seen"]
+
+# the hostname does not change during the lifetime of the process
+WORKER_HOSTNAME = socket.gethostname()
+
 
 class Status(Enum):
     CREATED = "created"
@@ -50,6 +72,17 @@ class JobStatus(Enum):
     UNSET = None
 
 
+TERMINAL_JOB_STATUSES = frozenset(
+    {JobStatus.ERROR, JobStatus.COMPLETED, JobStatus.CANCELED}
+)
+
+# plain status strings used when building sync job documents and queries
+_PENDING = JobStatus.PENDING.value
+_SUSPENDED = JobStatus.SUSPENDED.value
+_IN_PROGRESS = JobStatus.IN_PROGRESS.value
+_CANCELING = JobStatus.CANCELING.value
+
+
 class JobTriggerMethod(Enum):
     ON_DEMAND = "on_demand"
     SCHEDULED = "scheduled"
@@ -79,7 +112,7 @@ class ConnectorIndex(ESIndex):
         super().__init__(index_name=CONNECTORS_INDEX, elastic_config=elastic_config)
 
     async def heartbeat(self, doc_id):
-        await self.update(doc_id=doc_id, doc={"last_seen": iso_utc()})
+        await self.queue_update(doc_id=doc_id, doc={"last_seen": iso_utc()})
 
     async def supported_connectors(self, native_service_types=None, connector_ids=None):
         if native_service_types is None:
@@ -109,14 +142,20 @@ class ConnectorIndex(ESIndex):
         }
         if len(native_service_types) > 0 and len(connector_ids) > 0:
             query = {
-                "bool": {"should": [native_connectors_query, custom_connectors_query]}
+                "bool": {
+                    "should": [native_connectors_query, custom_connectors_query],
+                    "minimum_should_match": 1,
+                }
             }
         elif len(native_service_types) > 0:
             query = native_connectors_query
         else:
             query = custom_connectors_query
 
-        async for connector in self.get_all_docs(query=query):
+        async for connector in self.get_all_docs(
+            query={"constant_score": {"filter": query}},
+            source=CONNECTOR_SOURCE_FIELDS,
+        ):
             yield connector
 
     def _create_object(self, doc_source):
@@ -169,7 +208,7 @@ class SyncJob(ESDocument):
 
     @property
     def terminated(self):
-        return self.status in (JobStatus.ERROR, JobStatus.COMPLETED, JobStatus.CANCELED)
+        return self.status in TERMINAL_JOB_STATUSES
 
     @property
     def indexed_document_count(self):
@@ -196,11 +235,12 @@ class SyncJob(ESDocument):
             )
 
     async def claim(self):
+        now = iso_utc()
         doc = {
-            "status": JobStatus.IN_PROGRESS.value,
-            "started_at": iso_utc(),
-            "last_seen": iso_utc(),
-            "worker_hostname": socket.gethostname(),
+            "status": _IN_PROGRESS,
+            "started_at": now,
+            "last_seen": now,
+            "worker_hostname": WORKER_HOSTNAME,
         }
         await self.index.update(doc_id=self.id, doc=doc)
 
@@ -231,15 +271,16 @@ class SyncJob(ESDocument):
             ingestion_stats = {}
         if connector_metadata is None:
             connector_metadata = {}
+        now = iso_utc()
         doc = {
-            "last_seen": iso_utc(),
+            "last_seen": now,
             "status": status.value,
             "error": error,
         }
-        if status in (JobStatus.ERROR, JobStatus.COMPLETED, JobStatus.CANCELED):
-            doc["completed_at"] = iso_utc()
+        if status in TERMINAL_JOB_STATUSES:
+            doc["completed_at"] = now
         if status == JobStatus.CANCELED:
-            doc["canceled_at"] = iso_utc()
+            doc["canceled_at"] = now
         doc.update(ingestion_stats)
         if len(connector_metadata) > 0:
             doc["metadata"] = connector_metadata
@@ -262,20 +303,18 @@ class Filtering:
         return self.get_filter(filter_state="draft", domain=domain)
 
     def get_filter(self, filter_state="active", domain=DEFAULT_DOMAIN):
-        return next(
-            (
-                Filter(filter_[filter_state])
-                for filter_ in self.filtering
-                if filter_["domain"] == domain
-            ),
-            Filter(),
-        )
+        for filter_ in self.filtering:
+            if filter_["domain"] == domain:
+                return Filter(filter_[filter_state])
+        return EMPTY_FILTER
 
     def to_list(self):
         return list(self.filtering)
 
 
 class Filter(dict):
+    __slots__ = ("advanced_rules", "basic_rules", "validation")
+
     def __init__(self, filter_=None):
         if filter_ is None:
             filter_ = {}
@@ -302,14 +341,21 @@ class Filter(dict):
         """
         Transform the filtering in .elastic-connectors to filtering ready-to-use in .elastic-connectors-sync-jobs
         """
-        # deepcopy to not change the reference resulting in changing .elastic-connectors filtering
+        # copy to not change the reference resulting in changing .elastic-connectors filtering
+        # the filter is plain JSON, so a JSON round trip is much cheaper than deepcopy
         filtering = (
-            {"advanced_snippet": {}, "rules": []} if len(self) == 0 else deepcopy(self)
+            {"advanced_snippet": {}, "rules": []}
+            if len(self) == 0
+            else json.loads(json.dumps(self))
         )
 
         return filtering
 
 
+# shared by all lookups for a missing domain, must not be mutated
+EMPTY_FILTER = Filter()
+
+
 PIPELINE_DEFAULT = {
     "name": "ent-search-generic-ingestion",
     "extract_binary_content": True,
@@ -318,13 +364,9 @@ PIPELINE_DEFAULT = {
 }
 
 
-class Pipeline(UserDict):
-    def __init__(self, data):
-        if data is None:
-            data = {}
-        default = PIPELINE_DEFAULT.copy()
-        default.update(data)
-        super().__init__(default)
+class Pipeline(dict):
+    def __init__(self, data=None):
+        super().__init__(PIPELINE_DEFAULT if not data else {**PIPELINE_DEFAULT, **data})
 
 
 class Features:
@@ -335,56 +377,73 @@ class Features:
     BASIC_RULES_OLD = "basic_rules_old"
     ADVANCED_RULES_OLD = "advanced_rules_old"
 
+    _FEATURE_LOOKUPS = {
+        BASIC_RULES_NEW: lambda self: self._nested_feature_enabled(
+            ["sync_rules", "basic", "enabled"], default=False
+        ),
+        ADVANCED_RULES_NEW: lambda self: self._nested_feature_enabled(
+            ["sync_rules", "advanced", "enabled"], default=False
+        ),
+        BASIC_RULES_OLD: lambda self: self.features.get("filtering_rules", False),
+        ADVANCED_RULES_OLD: lambda self: self.features.get(
+            "filtering_advanced_config", False
+        ),
+    }
+
     def __init__(self, features=None):
         if features is None:
             features = {}
 
         self.features = features
+        self._sync_rules_enabled = None
+        # feature -> bool, features are read-only once loaded
+        self._enabled_features = {}
 
     def sync_rules_enabled(self):
-        return any(
-            [
-                self.feature_enabled(Features.BASIC_RULES_NEW),
-                self.feature_enabled(Features.BASIC_RULES_OLD),
-                self.feature_enabled(Features.ADVANCED_RULES_NEW),
-                self.feature_enabled(Features.ADVANCED_RULES_OLD),
-            ]
-        )
+        if self._sync_rules_enabled is None:
+            # current flags first, the old ones are only kept for backwards compatibility
+            self._sync_rules_enabled = bool(
+                self.feature_enabled(Features.BASIC_RULES_NEW)
+                or self.feature_enabled(Features.ADVANCED_RULES_NEW)
+                or self.feature_enabled(Features.BASIC_RULES_OLD)
+                or self.feature_enabled(Features.ADVANCED_RULES_OLD)
+            )
+        return self._sync_rules_enabled
 
     def feature_enabled(self, feature):
-        match feature:
-            case Features.BASIC_RULES_NEW:
-                return self._nested_feature_enabled(
-                    ["sync_rules", "basic", "enabled"], default=False
-                )
-            case Features.ADVANCED_RULES_NEW:
-                return self._nested_feature_enabled(
-                    ["sync_rules", "advanced", "enabled"], default=False
-                )
-            case Features.BASIC_RULES_OLD:
-                return self.features.get("filtering_rules", False)
-            case Features.ADVANCED_RULES_OLD:
-                return self.features.get("filtering_advanced_config", False)
-            case _:
-                return False
-
-    def _nested_feature_enabled(self, keys, default=None):
-        def nested_get(dictionary, keys_, default_=None):
-            if dictionary is None:
-                return default_
-
-            if not keys_:
-                return dictionary
-
-            if not isinstance(dictionary, dict):
-                return default_
+        try:
+            return self._enabled_features[feature]
+        except KeyError:
+            pass
 
-            return nested_get(dictionary.get(keys_[0]), keys_[1:], default_)
+        lookup = self._FEATURE_LOOKUPS.get(feature)
+        enabled = False if lookup is None else lookup(self)
+        self._enabled_features[feature] = enabled
+        return enabled
 
-        return nested_get(self.features, keys, default)
+    def _nested_feature_enabled(self, keys, default=None):
+        value = self.features
+        for key in keys:
+            if not isinstance(value, dict):
+                return default
+            value = value.get(key)
+            if value is None:
+                return default
+        return value
 
 
 class Connector(ESDocument):
+    # wrappers built from the doc source, dropped on reload()
+    CACHED_PROPERTIES = (
+        "scheduling",
+        "configuration",
+        "filtering",
+        "pipeline",
+        "features",
+    )
+    # (raw last_seen, parsed last_seen)
+    _last_seen_cache = None
+
     @property
     def status(self):
         return Status(self.get("status"))
@@ -396,9 +455,15 @@ class Connector(ESDocument):
     @property
     def last_seen(self):
         last_seen = self.get("last_seen")
-        if last_seen is not None:
-            last_seen = datetime.fromisoformat(last_seen)  # pyright: ignore
-        return last_seen
+        if last_seen is None:
+            return None
+        # parse the timestamp only when the raw value changes
+        if self._last_seen_cache is None or self._last_seen_cache[0] != last_seen:
+            self._last_seen_cache = (
+                last_seen,
+                datetime.fromisoformat(last_seen),  # pyright: ignore
+            )
+        return self._last_seen_cache[1]
 
     @property
     def native(self):
@@ -408,11 +473,11 @@ class Connector(ESDocument):
     def sync_now(self):
         return self.get("sync_now", default=False)
 
-    @property
+    @functools.cached_property
     def scheduling(self):
         return self.get("scheduling", default={})
 
-    @property
+    @functools.cached_property
     def configuration(self):
         return DataSourceConfiguration(self.get("configuration"))
 
@@ -424,15 +489,15 @@ class Connector(ESDocument):
     def language(self):
         return self.get("language")
 
-    @property
+    @functools.cached_property
     def filtering(self):
         return Filtering(self.get("filtering"))
 
-    @property
+    @functools.cached_property
     def pipeline(self):
         return Pipeline(self.get("pipeline"))
 
-    @property
+    @functools.cached_property
     def features(self):
         return Features(self.get("features"))
 
@@ -440,10 +505,16 @@ class Connector(ESDocument):
     def last_sync_status(self):
         return JobStatus(self.get("last_sync_status"))
 
+    async def reload(self):
+        await super().reload()
+        for name in self.CACHED_PROPERTIES:
+            self.__dict__.pop(name, None)
+
     async def heartbeat(self, interval):
+        last_seen = self.last_seen
         if (
-            self.last_seen is None
-            or (datetime.now(timezone.utc) - self.last_seen).total_seconds() > interval
+            last_seen is None
+            or (datetime.now(timezone.utc) - last_seen).total_seconds() > interval
         ):
             logger.debug(f"Sending heartbeat for connector {self.id}")
             await self.index.heartbeat(doc_id=self.id)
@@ -462,7 +533,7 @@ class Connector(ESDocument):
         return next_run(self.scheduling.get("interval"))
 
     async def reset_sync_now_flag(self):
-        await self.index.update(doc_id=self.id, doc={"sync_now": False})
+        await self.index.queue_update(doc_id=self.id, doc={"sync_now": False})
 
     async def sync_starts(self):
         doc = {
@@ -570,24 +641,29 @@ class Connector(ESDocument):
             f"Filtering validation result for connector {self.id}: {validation_result.state.value}"
         )
 
-        filtering = self.filtering.to_list()
-        for filter_ in filtering:
+        validation = validation_result.to_dict()
+        # build new filter dicts instead of mutating the ones in the doc source
+        filtering = []
+        for filter_ in self.filtering.filtering:
             if filter_.get("domain", "") == Filtering.DEFAULT_DOMAIN:
-                filter_.get("draft", {"validation": {}})[
-                    "validation"
-                ] = validation_result.to_dict()
+                draft = filter_.get("draft", {}) | {"validation": validation}
+                filter_ = filter_ | {"draft": draft}
                 if validation_result.state == FilteringValidationState.VALID:
-                    filter_["active"] = filter_.get("draft")
+                    filter_["active"] = draft
+            filtering.append(filter_)
 
         await self.index.update(doc_id=self.id, doc={"filtering": filtering})
         await self.reload()
 
-    async def document_count(self):
-        await self.index.client.indices.refresh(
-            index=self.index_name, ignore_unavailable=True
-        )
+    async def document_count(self, refresh=True):
+        # _count only sees refreshed segments, so refreshing is only needed when
+        # the index was written to since the last refresh
+        if refresh:
+            await self.index.client.indices.refresh(
+                index=self.index_name, ignore_unavailable=True
+            )
         result = await self.index.client.count(
-            index=self.index_name, ignore_unavailable=True
+            index=self.index_name, ignore_unavailable=True, preference="_local"
         )
         return result["count"]
 
@@ -625,32 +701,33 @@ class SyncJobIndex(ESIndex):
             else JobTriggerMethod.SCHEDULED
         )
         filtering = connector.filtering.get_active_filter().transform_filtering()
+        now = iso_utc()
         job_def = {
             "connector": {
                 "id": connector.id,
                 "filtering": filtering,
                 "index_name": connector.index_name,
                 "language": connector.language,
-                "pipeline": connector.pipeline.data,
+                "pipeline": connector.pipeline,
                 "service_type": connector.service_type,
                 "configuration": connector.configuration.to_dict(),
             },
             "trigger_method": trigger_method.value,
-            "status": JobStatus.PENDING.value,
-            "created_at": iso_utc(),
-            "last_seen": iso_utc(),
+            "status": _PENDING,
+            "created_at": now,
+            "last_seen": now,
         }
         return await self.index(job_def)
 
     async def pending_jobs(self, connector_ids):
         query = {
             "bool": {
-                "must": [
+                "filter": [
                     {
                         "terms": {
                             "status": [
-                                JobStatus.PENDING.value,
-                                JobStatus.SUSPENDED.value,
+                                _PENDING,
+                                _SUSPENDED,
                             ]
                         }
                     },
@@ -658,12 +735,17 @@ class SyncJobIndex(ESIndex):
                 ]
             }
         }
-        async for job in self.get_all_docs(query=query):
+        async for job in self.get_all_docs(query={"constant_score": {"filter": query}}):
             yield job
 
     async def orphaned_jobs(self, connector_ids):
-        query = {"bool": {"must_not": {"terms": {"connector.id": connector_ids}}}}
-        async for job in self.get_all_docs(query=query):
+        query = {
+            "bool": {
+                "filter": [],
+                "must_not": {"terms": {"connector.id": connector_ids}},
+            }
+        }
+        async for job in self.get_all_docs(query={"constant_score": {"filter": query}}):
             yield job
 
     async def idle_jobs(self, connector_ids):
@@ -674,8 +756,8 @@ class SyncJobIndex(ESIndex):
                     {
                         "terms": {
                             "status": [
-                                JobStatus.IN_PROGRESS.value,
-                                JobStatus.CANCELING.value,
+                                _IN_PROGRESS,
+                                _CANCELING,
                             ]
                         }
                     },
@@ -684,7 +766,9 @@ class SyncJobIndex(ESIndex):
             }
         }
 
-        async for job in self.get_all_docs(query=query):
+        async for job in self.get_all_docs(
+            query={"constant_score": {"filter": query}}, source=SYNC_JOB_SOURCE_FIELDS
+        ):
             yield job
 
     async def delete_jobs(self, job_ids):
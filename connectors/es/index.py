@@ -3,18 +3,88 @@
 # or more contributor license agreements. Licensed under the Elastic License 2.0;
 # you may not use this file except in compliance with the Elastic License 2.0.
 #
+from contextlib import asynccontextmanager
+
 from elasticsearch import ApiError
 
 from connectors.es import ESClient
 from connectors.logger import logger
 
 DEFAULT_PAGE_SIZE = 100
+DEFAULT_RETRY_ON_CONFLICT = 3
 
 
 class DocumentNotFoundError(Exception):
     pass
 
 
+class UpdateBatchError(Exception):
+    pass
+
+
+class UpdateBatcher:
+    """
+    Collects partial document updates and sends them to Elasticsearch in a single _bulk request
+
+    Args:
+        index (ESIndex): Index the documents belong to
+        retry_on_conflict (int): How many times Elasticsearch retries an update on version conflict
+    """
+
+    def __init__(self, index, retry_on_conflict=DEFAULT_RETRY_ON_CONFLICT):
+        self.index = index
+        self.retry_on_conflict = retry_on_conflict
+        self.updates = []
+
+    def __len__(self):
+        return len(self.updates)
+
+    def queue_update(self, doc_id, doc):
+        self.updates.append((doc_id, doc))
+
+    async def flush(self):
+        """
+        Sends the queued updates.
+
+        Raises:
+            UpdateBatchError: Some of the updates failed, like `ESIndex.update` would have
+        """
+        if len(self.updates) == 0:
+            return
+
+        operations = []
+        for doc_id, doc in self.updates:
+            operations.append(
+                {
+                    "update": {
+                        "_id": doc_id,
+                        "_index": self.index.index_name,
+                        "retry_on_conflict": self.retry_on_conflict,
+                    }
+                }
+            )
+            operations.append({"doc": doc})
+        self.updates = []
+
+        logger.debug(
+            f"Sending {len(operations) // 2} batched updates to {self.index.index_name}"
+        )
+        res = await self.index.client.bulk(operations=operations)
+        if res.get("errors"):
+            failures = 0
+            for item in res["items"]:
+                for op, data in item.items():
+                    if "error" in data:
+                        failures += 1
+                        logger.error(
+                            f"operation {op} failed for document {data.get('_id')}, {data['error']}"
+                        )
+            if failures > 0:
+                raise UpdateBatchError(
+                    f"{failures} of {len(operations) // 2} batched updates to {self.index.index_name} failed"
+                )
+
+
 class ESIndex(ESClient):
     """
     Encapsulates the work with Elasticsearch index.
@@ -32,6 +102,7 @@ class ESIndex(ESClient):
         super().__init__(elastic_config)
         self.index_name = index_name
         self.elastic_config = elastic_config
+        self._update_batcher = None
 
     def _create_object(self, doc):
         """
@@ -77,13 +148,49 @@ class ESIndex(ESClient):
             if_primary_term=if_primary_term,
         )
 
-    async def get_all_docs(self, query=None, page_size=DEFAULT_PAGE_SIZE):
+    async def queue_update(self, doc_id, doc):
+        """
+        Updates the document, deferring the update to the end of the current
+        `batched_updates` block if there is one.
+
+        Args:
+            doc_id (str): Id of the document to update
+            doc (dict): Partial document
+        """
+        if self._update_batcher is None:
+            await self.update(doc_id=doc_id, doc=doc)
+        else:
+            self._update_batcher.queue_update(doc_id, doc)
+
+    async def flush_updates(self):
+        """Sends the updates queued so far in the current `batched_updates` block"""
+        if self._update_batcher is not None:
+            await self._update_batcher.flush()
+
+    @asynccontextmanager
+    async def batched_updates(self, retry_on_conflict=DEFAULT_RETRY_ON_CONFLICT):
+        """
+        Collects the updates made through `queue_update` and sends them in a
+        single _bulk request when the block exits.
+
+        Args:
+            retry_on_conflict (int): How many times Elasticsearch retries an update on version conflict
+        """
+        self._update_batcher = UpdateBatcher(self, retry_on_conflict)
+        try:
+            yield self._update_batcher
+        finally:
+            batcher, self._update_batcher = self._update_batcher, None
+            await batcher.flush()
+
+    async def get_all_docs(self, query=None, page_size=DEFAULT_PAGE_SIZE, source=None):
         """
         Lookup for elasticsearch documents using {query}
 
         Args:
             query (dict): Represents an Elasticsearch query
             page_size (int): Number of documents per query
+            source (list): Fields of _source to return, the whole _source is returned if None
         Returns:
             Iterator
         """
@@ -104,6 +211,10 @@ class ESIndex(ESClient):
                     size=page_size,
                     expand_wildcards="hidden",
                     seq_no_primary_term=True,
+                    source=source,
+                    # scores are never used, index order is the cheapest to iterate
+                    sort=["_doc"],
+                    track_scores=False,
                 )
             except ApiError as e:
                 logger.critical(f"The server returned {e.status_code}")
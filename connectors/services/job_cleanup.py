@@ -90,13 +90,15 @@ class JobCleanUpService(BaseService):
     async def _process_idle_jobs(self):
         try:
             logger.info("Start cleaning up idle jobs...")
-            connector_ids = [
-                connector.id
+            # keep the connectors around so they don't have to be fetched one by one
+            connectors = {
+                connector.id: connector
                 async for connector in self.connector_index.supported_connectors(
                     native_service_types=self.native_service_types,
                     connector_ids=self.connector_ids,
                 )
-            ]
+            }
+            connector_ids = list(connectors.keys())
 
             marked_count = total_count = 0
             async for job in self.sync_job_index.idle_jobs(connector_ids=connector_ids):
@@ -107,11 +109,8 @@ class JobCleanUpService(BaseService):
                     await job.fail(message=IDLE_JOB_ERROR)
                     marked_count += 1
 
-                    try:
-                        connector = await self.connector_index.fetch_by_id(
-                            doc_id=connector_id
-                        )
-                    except DocumentNotFoundError:
+                    connector = connectors.get(connector_id)
+                    if connector is None:
                         logger.warning(
                             f"Could not found connector by id #{connector_id}"
                         )
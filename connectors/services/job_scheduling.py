@@ -11,6 +11,7 @@ Event loop
 - mirrors an Elasticsearch index with a collection of documents
 """
 from connectors.byoc import (
+    RETRY_ON_CONFLICT,
     SYNC_DISABLED,
     ConnectorIndex,
     ConnectorUpdateError,
@@ -116,6 +117,8 @@ class JobSchedulingService(BaseService):
         job_id = await self.sync_job_index.create(connector)
         if connector.sync_now:
             await connector.reset_sync_now_flag()
+        # don't hold the batched heartbeats back while waiting for a free sync slot
+        await self.connector_index.flush_updates()
         try:
             sync_job = await self.sync_job_index.fetch_by_id(job_id)
         except DocumentNotFoundError:
@@ -158,11 +161,15 @@ class JobSchedulingService(BaseService):
 
                 try:
                     logger.debug(f"Polling every {self.idling} seconds")
-                    async for connector in self.connector_index.supported_connectors(
-                        native_service_types=native_service_types,
-                        connector_ids=connector_ids,
+                    # heartbeats and sync_now resets are sent in one _bulk request per round
+                    async with self.connector_index.batched_updates(
+                        retry_on_conflict=RETRY_ON_CONFLICT
                     ):
-                        await self._sync(connector, es)
+                        async for connector in self.connector_index.supported_connectors(
+                            native_service_types=native_service_types,
+                            connector_ids=connector_ids,
+                        ):
+                            await self._sync(connector, es)
                 except Exception as e:
                     logger.critical(e, exc_info=True)
                     self.raise_if_spurious(e)
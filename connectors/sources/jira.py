@@ -6,39 +6,49 @@
 """Jira source module responsible to fetch documents from Jira on-prem or cloud server.
 """
 import asyncio
-import os
-from copy import copy
+import json
+import random
+from collections import deque
 from datetime import datetime
-from functools import partial
+from functools import cache, partial
 from urllib import parse
 
-import aiofiles
 import aiohttp
 import pytz
-from aiofiles.os import remove
-from aiofiles.tempfile import NamedTemporaryFile
-from aiohttp.client_exceptions import ServerDisconnectedError
+from aiohttp.client_exceptions import ClientResponseError, ServerDisconnectedError
 
 from connectors.logger import logger
 from connectors.source import BaseDataSource
 from connectors.utils import (
     TIKA_SUPPORTED_FILETYPES,
     CancellableSleeps,
-    ConcurrentTasks,
     MemQueue,
-    convert_to_b64,
+    get_base64_value,
     iso_utc,
     ssl_context,
 )
 
 RETRY_INTERVAL = 2
+MAX_RETRY_INTERVAL = 30  # seconds
+MAX_RETRY_AFTER = 300  # seconds, longest Retry-After of a 429 response that is honored
 FILE_SIZE_LIMIT = 10485760
+SMALL_ATTACHMENT_SIZE = 512 * 1024  # attachments up to that size are read at once
 
 FETCH_SIZE = 100
-CHUNK_SIZE = 1024
-QUEUE_MEM_SIZE = 5 * 1024 * 1024  # Size in Megabytes
-MAX_CONCURRENCY = 5
+# the queue only holds documents and download partials, attachment contents are
+# downloaded later by the sink. Leave room for bursts of large issue documents
+QUEUE_MEM_SIZE = 25 * 1024 * 1024  # Size in bytes
 MAX_CONCURRENT_DOWNLOADS = 50  # Max concurrent download supported by jira
+MAX_CONCURRENCY = 5  # issues whose attachments are queued at the same time
+DNS_CACHE_TTL = 300  # seconds
+KEEPALIVE_TIMEOUT = 75  # seconds
+
+# only fields of an attachment that get_content reads, the rest of the attachment
+# payload (author, avatars...) doesn't need to be carried on the queue
+ATTACHMENT_CONTENT_FIELDS = ("id", "filename", "size", "created")
+
+# put on the queue once all the producers of get_docs are done
+END_OF_QUEUE = object()
 
 PING = "ping"
 PROJECT = "project"
@@ -72,17 +82,24 @@ class JiraDataSource(BaseDataSource):
         self._sleeps = CancellableSleeps()
         self.is_cloud = self.configuration["is_cloud"]
         self.host_url = self.configuration["host_url"]
+        # the API paths are absolute, so they replace any path of host_url
+        url_base = parse.urljoin(self.host_url, "/").rstrip("/")
+        self._urls = {name: f"{url_base}{path}" for name, path in URLS.items()}
         self.ssl_enabled = self.configuration["ssl_enabled"]
         self.certificate = self.configuration["ssl_ca"]
         self.enable_content_extraction = self.configuration["enable_content_extraction"]
         self.retry_count = self.configuration["retry_count"]
         self.concurrent_downloads = self.configuration["concurrent_downloads"]
 
-        self.ssl_ctx = False
+        self.ssl_ctx = None
         self.session = None
-        self.tasks = 0
+        # serializes the rebuild of the session shared by concurrent requests
+        self._session_lock = asyncio.Lock()
+        self.timezone = None
+        self._producers_alive = 0
         self.queue = MemQueue(maxmemsize=QUEUE_MEM_SIZE, refresh_timeout=120)
-        self.fetchers = ConcurrentTasks(max_concurrency=MAX_CONCURRENCY)
+        # bounds every in-flight request to Jira, whatever it is fetching
+        self._sem = asyncio.Semaphore(self.concurrent_downloads)
 
     @classmethod
     def get_default_configuration(cls):
@@ -149,6 +166,19 @@ class JiraDataSource(BaseDataSource):
             },
         }
 
+    @classmethod
+    @cache
+    def _field_labels(cls):
+        """Labels of the configuration fields, built once from the default configuration
+
+        Returns:
+            dictionary: Label of each configuration field
+        """
+        return {
+            name: field["label"]
+            for name, field in cls.get_default_configuration().items()
+        }
+
     def tweak_bulk_options(self, options):
         """Tweak bulk options as per concurrent downloads support by jira
 
@@ -170,10 +200,10 @@ class JiraDataSource(BaseDataSource):
             else ["host_url", "username", "password"]
         )
 
-        default_config = self.get_default_configuration()
+        field_labels = self._field_labels()
 
         if empty_connection_fields := [
-            default_config[field]["label"]
+            field_labels[field]
             for field in connection_fields
             if self.configuration[field] == ""
         ]:
@@ -189,6 +219,11 @@ class JiraDataSource(BaseDataSource):
                 f"Configured concurrent downloads can't be set more than {MAX_CONCURRENT_DOWNLOADS}."
             )
 
+    def _ensure_ssl(self):
+        """Builds the SSL context from the configured certificate once"""
+        if self.ssl_enabled and self.ssl_ctx is None:
+            self.ssl_ctx = ssl_context(certificate=self.certificate)
+
     def _generate_session(self):
         """Generates an aiohttp Client Session for handling the connections"""
         logger.debug("Creating an aiohttp Client Session")
@@ -207,10 +242,25 @@ class JiraDataSource(BaseDataSource):
         request_headers = {
             "accept": "application/json",
             "content-type": "application/json",
+            "accept-encoding": "gzip, deflate",
+            # encoded once here rather than by aiohttp for every request, it is
+            # still dropped on redirects to another origin
+            "authorization": basic_auth.encode(),
         }
         timeout = aiohttp.ClientTimeout(total=None)  # pyright: ignore
+        self._ensure_ssl()
+        # keep connections alive so that attachment downloads reuse them instead
+        # of opening a new TCP/TLS connection for every request
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrent_downloads,
+            limit_per_host=self.concurrent_downloads,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            enable_cleanup_closed=True,
+            ssl=self.ssl_ctx or False,
+        )
         self.session = aiohttp.ClientSession(
-            auth=basic_auth,
+            connector=connector,
             headers=request_headers,
             timeout=timeout,
             raise_for_status=True,
@@ -224,9 +274,73 @@ class JiraDataSource(BaseDataSource):
         await self.session.close()
         self.session = None
 
+    async def _reset_session(self, session):
+        """Replaces a session whose server got disconnected.
+
+        Requests run concurrently, so the session is only replaced if no other
+        request did it already. Unlike `close`, the backoff sleeps of the other
+        requests are left alone.
+
+        Args:
+            session (aiohttp.ClientSession): Session the failed request was made with
+        """
+        async with self._session_lock:
+            if self.session is not session:
+                return
+            await session.close()
+            self._generate_session()
+
+    async def _handle_api_call_error(self, exception, retry, session):
+        """Prepare the retry of a failed API call, or raise once the retries are exhausted.
+
+        Args:
+            exception (Exception): Exception raised by the API call
+            retry (int): Number of the upcoming retry
+            session (aiohttp.ClientSession): Session the API call was made with
+
+        Raises:
+            exception: The exception of the API call when no retry is left.
+        """
+        if isinstance(exception, ServerDisconnectedError):
+            await self._reset_session(session=session)
+        if retry > self.retry_count:
+            raise exception
+        logger.warning(
+            f"Retry count: {retry} out of {self.retry_count}. Exception: {exception}"
+        )
+        await self._sleeps.sleep(self._retry_delay(exception=exception, retry=retry))
+
+    def _retry_delay(self, exception, retry):
+        """Number of seconds to wait before retrying a failed API call.
+
+        Honors the `Retry-After` header of a 429 response, up to MAX_RETRY_AFTER,
+        otherwise backs off exponentially up to MAX_RETRY_INTERVAL, with jitter so
+        that workers don't retry all at once.
+
+        Args:
+            exception (Exception): Exception raised by the API call
+            retry (int): Number of the upcoming retry
+
+        Returns:
+            float: Delay in seconds
+        """
+        if (
+            isinstance(exception, ClientResponseError)
+            and exception.status == 429
+            and exception.headers is not None
+        ):
+            try:
+                return min(float(exception.headers["Retry-After"]), MAX_RETRY_AFTER)
+            except (KeyError, ValueError):
+                pass
+        delay = min(MAX_RETRY_INTERVAL, RETRY_INTERVAL**retry)
+        return delay * random.uniform(0.5, 1.5)
+
     async def _api_call(self, url_name, **url_kwargs):
         """Make a GET call for Atlassian API using the passed url_name with retry for the failed API calls.
 
+        Only used to stream a response body, use `_request_json` for JSON APIs.
+
         Args:
             url_name (str): URL Name to identify the API endpoint to hit
             url_kwargs (dict): Url kwargs to format the query.
@@ -238,53 +352,100 @@ class JiraDataSource(BaseDataSource):
             response: Return api response.
         """
         retry = 0
-        url = parse.urljoin(self.host_url, URLS[url_name].format(**url_kwargs))
+        url = self._urls[url_name].format_map(url_kwargs)
         while True:
+            session = self.session
             try:
-                async with self.session.get(  # pyright: ignore
-                    url=url,
-                    ssl=self.ssl_ctx,
+                async with self._sem, session.get(  # pyright: ignore
+                    url=url
                 ) as response:
                     yield response
                     break
             except Exception as exception:
-                if isinstance(
-                    exception,
-                    ServerDisconnectedError,
-                ):
-                    await self.close()
-                    self._generate_session()
                 retry += 1
-                if retry > self.retry_count:
-                    raise exception
-                logger.warning(
-                    f"Retry count: {retry} out of {self.retry_count}. Exception: {exception}"
+                await self._handle_api_call_error(
+                    exception=exception, retry=retry, session=session
                 )
-                await self._sleeps.sleep(RETRY_INTERVAL**retry)
+
+    async def _request_json(self, url_name, **url_kwargs):
+        """Make a GET call for Atlassian API using the passed url_name with retry for the failed API calls.
+
+        Args:
+            url_name (str): URL Name to identify the API endpoint to hit
+            url_kwargs (dict): Url kwargs to format the query.
+
+        Raises:
+            exception: An instance of an exception class.
+
+        Returns:
+            response: Decoded JSON response.
+        """
+        retry = 0
+        url = self._urls[url_name].format_map(url_kwargs)
+        while True:
+            session = self.session
+            try:
+                async with self._sem, session.get(  # pyright: ignore
+                    url=url
+                ) as response:
+                    return json.loads(await response.read())
+            except Exception as exception:
+                retry += 1
+                await self._handle_api_call_error(
+                    exception=exception, retry=retry, session=session
+                )
+
+    async def _get_page(self, url_name, start_at):
+        """Fetch a single page of a paginated Jira API.
+
+        Args:
+            url_name (str): URL Name to identify the API endpoint to hit
+            start_at (int): Index of the first item of the page
+
+        Returns:
+            dictionary: Page response
+        """
+        return await self._request_json(
+            url_name=url_name, start_at=start_at, max_results=FETCH_SIZE
+        )
 
     async def _paginated_api_call(self, url_name):
         """Make a paginated API call for Jira objects using the passed url_name with retry for the failed API calls.
 
+        The first page tells how many items there are, the following pages are then
+        fetched ahead of the consumer, a few at a time, and yielded in order.
+
         Args:
             url_name (str): URL Name to identify the API endpoint to hit
 
         Yields:
             response: Return api response.
         """
-        start_at = 0
-
-        should_paginate = True
-        while should_paginate:
-            async for response in self._api_call(
-                url_name=url_name, start_at=start_at, max_results=FETCH_SIZE
-            ):
-                response_json = await response.json()
-                total = response_json["total"]
-                yield response_json
-                if start_at + FETCH_SIZE > total or total <= FETCH_SIZE:
-                    should_paginate = False
-                    break
-                start_at += FETCH_SIZE
+        first_page = await self._get_page(url_name=url_name, start_at=0)
+        yield first_page
+
+        offsets = iter(range(FETCH_SIZE, first_page["total"], FETCH_SIZE))
+        prefetched = deque()
+
+        def _prefetch_next_page():
+            start_at = next(offsets, None)
+            if start_at is not None:
+                prefetched.append(
+                    asyncio.create_task(
+                        self._get_page(url_name=url_name, start_at=start_at)
+                    )
+                )
+
+        for _ in range(self.concurrent_downloads):
+            _prefetch_next_page()
+        try:
+            while prefetched:
+                page = await prefetched.popleft()
+                _prefetch_next_page()
+                yield page
+        finally:
+            for task in prefetched:
+                task.cancel()
 
     async def get_content(self, issue_key, attachment, timestamp=None, doit=False):
         """Extracts the content for allowed file types.
@@ -303,7 +464,9 @@ class JiraDataSource(BaseDataSource):
             return
 
         attachment_name = attachment["filename"]
-        if os.path.splitext(attachment_name)[-1] not in TIKA_SUPPORTED_FILETYPES:
+        name, _, extension = attachment_name.rpartition(".")
+        # like os.path.splitext, a leading dot doesn't start an extension
+        if not name.strip(".") or f".{extension}" not in TIKA_SUPPORTED_FILETYPES:
             logger.warning(f"{attachment_name} is not supported by TIKA, skipping")
             return
 
@@ -319,29 +482,32 @@ class JiraDataSource(BaseDataSource):
             "_id": f"{issue_key}-{attachment['id']}",
             "_timestamp": attachment["created"],
         }
-        temp_filename = ""
         attachment_url = ATTACHMENT_CLOUD if self.is_cloud else ATTACHMENT_SERVER
-        async with NamedTemporaryFile(mode="wb", delete=False) as async_buffer:
-            async for response in self._api_call(
-                url_name=attachment_url,
-                attachment_id=attachment["id"],
-                attachment_name=attachment["filename"],
-            ):
-                async for data in response.content.iter_chunked(CHUNK_SIZE):
-                    await async_buffer.write(data)
-                temp_filename = str(async_buffer.name)
-
-        logger.debug(f"Calling convert_to_b64 for file : {attachment_name}")
-        await asyncio.to_thread(convert_to_b64, source=temp_filename)
-        async with aiofiles.open(file=temp_filename, mode="r") as async_buffer:
-            # base64 on macOS will add a EOL, so we strip() here
-            document["_attachment"] = (await async_buffer.read()).strip()
-        try:
-            await remove(temp_filename)
-        except Exception as exception:
+        # attachments are at most FILE_SIZE_LIMIT, so they are buffered in memory
+        # and encoded in-process instead of going through a temporary file
+        content = bytearray()
+        async for response in self._api_call(
+            url_name=attachment_url,
+            attachment_id=attachment["id"],
+            attachment_name=attachment["filename"],
+        ):
+            if attachment_size <= SMALL_ATTACHMENT_SIZE:
+                # small bodies are read in one go
+                content.extend(await response.read())
+            else:
+                # hand over whatever aiohttp has buffered rather than fixed size slices
+                async for data in response.content.iter_any():
+                    content.extend(data)
+                    if len(content) > FILE_SIZE_LIMIT:
+                        break
+
+        if len(content) > FILE_SIZE_LIMIT:
             logger.warning(
-                f"Could not remove file: {temp_filename}. Error: {exception}"
+                f"Downloaded content of file {attachment_name} is larger than {FILE_SIZE_LIMIT} bytes. Discarding file content"
             )
+            return
+
+        document["_attachment"] = get_base64_value(content=content)
         return document
 
     async def ping(self):
@@ -349,10 +515,11 @@ class JiraDataSource(BaseDataSource):
         if self.session is None:
             self._generate_session()
 
-        if self.ssl_enabled:
-            self.ssl_ctx = ssl_context(certificate=self.certificate)
         try:
-            await anext(self._api_call(url_name=PING))
+            myself = await self._request_json(url_name=PING)
+            # keep the user timezone so that _get_projects doesn't fetch it again,
+            # it can be hidden by the privacy settings of the user
+            self.timezone = myself.get("timeZone")
             logger.debug("Successfully connected to the Jira")
         except Exception:
             logger.exception("Error while connecting to the Jira")
@@ -364,21 +531,18 @@ class JiraDataSource(BaseDataSource):
         Yields:
             project: Project document to get indexed
         """
-        async for response in self._api_call(url_name=PING):
-            timezone = await response.json()
-            self.timezone = timezone["timeZone"]
-
-        async for response in self._api_call(url_name=PROJECT):
-            response = await response.json()
-            for project in response:
-                yield {
-                    "_id": f"{project['name']}-{project['id']}",
-                    "_timestamp": iso_utc(
-                        when=datetime.now(pytz.timezone(self.timezone))
-                    ),
-                    "Type": "Project",
-                    "Project": project,
-                }
+        if self.timezone is None:
+            myself = await self._request_json(url_name=PING)
+            self.timezone = myself["timeZone"]
+        timezone = pytz.timezone(self.timezone)
+
+        for project in await self._request_json(url_name=PROJECT):
+            yield {
+                "_id": f"{project['name']}-{project['id']}",
+                "_timestamp": iso_utc(when=datetime.now(timezone)),
+                "Type": "Project",
+                "Project": project,
+            }
 
     async def _get_issues(self):
         """Get issues with the help of REST APIs
@@ -388,19 +552,37 @@ class JiraDataSource(BaseDataSource):
             issue (dict): Issue response to fetch the attachments
         """
         async for response in self._paginated_api_call(url_name=ISSUES):
-            for issue in response.get("issues", []):
-                async for response in self._api_call(
-                    url_name=ISSUE_DATA, id=issue["key"]
-                ):
-                    issue = await response.json()
-                    if issue:
-                        response_fields = issue.get("fields")
-                        yield {
-                            "_id": f"{response_fields['project']['name']}-{issue['key']}",
-                            "_timestamp": response_fields["updated"],
-                            "Type": response_fields["issuetype"]["name"],
-                            "Issue": response_fields,
-                        }, issue
+            # fetch the issues of a page concurrently, they are yielded in order
+            tasks = [
+                asyncio.create_task(self._get_issue(issue_key=issue["key"]))
+                for issue in response.get("issues", [])
+            ]
+            try:
+                issues = await asyncio.gather(*tasks)
+            finally:
+                # no-op once they all succeeded, stops the siblings of a failed one
+                for task in tasks:
+                    task.cancel()
+            for issue in issues:
+                if issue:
+                    response_fields = issue.get("fields")
+                    yield {
+                        "_id": f"{response_fields['project']['name']}-{issue['key']}",
+                        "_timestamp": response_fields["updated"],
+                        "Type": response_fields["issuetype"]["name"],
+                        "Issue": response_fields,
+                    }, issue
+
+    async def _get_issue(self, issue_key):
+        """Get a single issue with all its fields
+
+        Args:
+            issue_key (str): Key of the issue to fetch
+
+        Returns:
+            issue (dict): Issue response
+        """
+        return await self._request_json(url_name=ISSUE_DATA, id=issue_key)
 
     async def _get_attachments(self, attachments, issue_key):
         """Get attachments of a specific issue
@@ -439,11 +621,13 @@ class JiraDataSource(BaseDataSource):
                     partial(
                         self.get_content,
                         issue_key=issue_key,
-                        attachment=copy(attachment),
+                        attachment={
+                            field: attachment[field]
+                            for field in ATTACHMENT_CONTENT_FIELDS
+                        },
                     ),
                 )
             )
-        await self.queue.put("FINISHED")  # pyright: ignore
 
     async def get_docs(self, filtering=None):
         """Executes the logic to fetch jira objects in async manner
@@ -456,40 +640,68 @@ class JiraDataSource(BaseDataSource):
         """
         if self.session is None:
             self._generate_session()
-        if self.ssl_enabled:
-            self.ssl_ctx = ssl_context(certificate=self.certificate)
 
         async def _project_task():
             """Coroutine to add projects documents to Queue"""
             async for project_data in self._get_projects():
                 await self.queue.put((project_data, None))  # pyright: ignore
-            await self.queue.put("FINISHED")  # pyright: ignore
 
         async def _document_task():
             """Coroutine to add issues/attachments to Queue"""
-            async for document, issue in self._get_issues():
-                await self.queue.put((document, None))  # pyright: ignore
-                attachments = issue["fields"]["attachment"]
-                if len(attachments) > 0:
-                    await self.fetchers.put(
-                        partial(self._grab_content, attachments, issue["key"])
-                    )
-                    self.tasks += 1
-            await self.queue.put("FINISHED")  # pyright: ignore
+            # attachments are queued as soon as their issue is fetched, a few issues
+            # at a time so that a full queue also holds up the listing of issues
+            slots = asyncio.Semaphore(MAX_CONCURRENCY)
+            attachment_tasks = set()
+
+            async def _attachment_task(attachments, issue_key):
+                try:
+                    await self._grab_content(attachments, issue_key)
+                finally:
+                    slots.release()
+
+            def _forget(task):
+                # failed tasks are kept, so that their exception is raised
+                if not task.cancelled() and task.exception() is None:
+                    attachment_tasks.discard(task)
 
-        project_task = asyncio.create_task(_project_task())
-        self.tasks += 1
-        document_task = asyncio.create_task(_document_task())
-        self.tasks += 1
+            try:
+                async for document, issue in self._get_issues():
+                    await self.queue.put((document, None))  # pyright: ignore
+                    attachments = issue["fields"]["attachment"]
+                    if len(attachments) > 0:
+                        await slots.acquire()
+                        for task in attachment_tasks:
+                            if task.done():
+                                task.result()
+                        task = asyncio.create_task(
+                            _attachment_task(attachments, issue["key"])
+                        )
+                        attachment_tasks.add(task)
+                        task.add_done_callback(_forget)
+                await asyncio.gather(*attachment_tasks)
+            finally:
+                for task in attachment_tasks:
+                    task.cancel()
+
+        async def _run_producer(producer):
+            """Runs a producer and marks the end of the queue once the last one is done"""
+            try:
+                await producer()
+            finally:
+                self._producers_alive -= 1
+                if self._producers_alive == 0:
+                    await self.queue.put(END_OF_QUEUE)  # pyright: ignore
+
+        self._producers_alive = 2
+        project_task = asyncio.create_task(_run_producer(_project_task))
+        document_task = asyncio.create_task(_run_producer(_document_task))
 
         # Consumer block to grab items from queue in a loop and yield one at a time.
-        # Once, all tasks are completed, loop is terminated to stop the consumer.
-        while self.tasks > 0:
+        # Once, all producers are done, loop is terminated to stop the consumer.
+        while True:
             _, item = await self.queue.get()
-            if item == "FINISHED":
-                self.tasks -= 1
-            else:
-                yield item
+            if item is END_OF_QUEUE:
+                break
+            yield item
 
-        await self.fetchers.join()
         await asyncio.gather(project_task, document_task)
@@ -4,18 +4,25 @@
 # you may not use this file except in compliance with the Elastic License 2.0.
 #
 """Tests the Jira database source class methods"""
+import asyncio
+import json
 import ssl
 from unittest import mock
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 import aiohttp
 import pytest
 from aiohttp import StreamReader
 
 from connectors.source import DataSourceConfiguration
-from connectors.sources.jira import JiraDataSource
+from connectors.sources.jira import (
+    ISSUES,
+    MAX_RETRY_AFTER,
+    MAX_RETRY_INTERVAL,
+    RETRY_INTERVAL,
+    JiraDataSource,
+)
 from connectors.sources.tests.support import create_source
-from connectors.utils import ssl_context
 
 HOST_URL = "http://127.0.0.1:8080"
 MOCK_PROJECT = {
@@ -58,14 +65,6 @@ EXPECTED_ATTACHMENT = {
 }
 
 
-class mock_ssl:
-    """This class contains methods which returns dummy ssl context"""
-
-    def load_verify_locations(self, cadata):
-        """This method verify locations"""
-        pass
-
-
 class MockResponse:
     """Mock class for ClientResponse"""
 
@@ -77,6 +76,10 @@ class MockResponse:
         """This Method is used to return a json response"""
         return self._json
 
+    async def read(self):
+        """This Method is used to return the raw json response"""
+        return json.dumps(self._json).encode("utf-8")
+
     async def __aexit__(self, exc_type, exc, tb):
         """Closes an async with block"""
         pass
@@ -93,6 +96,10 @@ class MockObjectResponse:
         """Setup a streamReader object"""
         self.content = StreamReader
 
+    async def read(self):
+        """Reads the whole body from the streamReader object"""
+        return b"".join([data async for data in self.content.iter_any()])
+
     async def __aexit__(self, exc_type, exc, tb):
         """Closes an async with block"""
         pass
@@ -118,10 +125,10 @@ class AsyncIter:
         return self.item[0]
 
 
-def side_effect_function(url, ssl):
+def side_effect_function(url):
     """Dynamically changing return values for API calls
     Args:
-        url, ssl: Params required for get call
+        url: Param required for get call
     """
     if url == f"{HOST_URL}/rest/api/2/search?maxResults=100&startAt=0":
         mocked_issue_response = {"issues": [{"key": "1234"}], "total": 101}
@@ -162,10 +169,26 @@ async def test_validate_config_for_host_url(patch_logger):
     source.configuration.set_field(name="host_url", value="")
 
     # Execute
-    with pytest.raises(Exception):
+    with pytest.raises(Exception, match="Jira host url"):
         await source.validate_config()
 
 
+@pytest.mark.parametrize(
+    "host_url",
+    ["http://127.0.0.1:8080", "http://127.0.0.1:8080/", "http://127.0.0.1:8080/jira"],
+)
+def test_urls_built_from_host_url(host_url):
+    """Test the API urls are built once from the host url"""
+    # Setup
+    source = create_source(JiraDataSource, host_url=host_url)
+
+    # Assert
+    assert (
+        source._urls[ISSUES].format_map({"max_results": 100, "start_at": 0})
+        == f"{HOST_URL}/rest/api/2/search?maxResults=100&startAt=0"
+    )
+
+
 @pytest.mark.asyncio
 async def test_api_call_negative():
     """Tests the _api_call function while getting an exception."""
@@ -202,13 +225,108 @@ async def test_api_call_when_server_is_down():
             await anext(source._api_call(url_name="ping"))
 
 
+@pytest.mark.asyncio
+async def test_request_json_when_server_is_down():
+    """Tests the _request_json function retries and raises while server gets disconnected."""
+
+    # Setup
+    source = create_source(JiraDataSource)
+    source.retry_count = 1
+    source._sleeps.sleep = AsyncMock()
+
+    # Execute
+    with patch.object(
+        aiohttp.ClientSession,
+        "get",
+        side_effect=aiohttp.ServerDisconnectedError("Something went wrong"),
+    ) as mock_get:
+        source._generate_session()
+        with pytest.raises(aiohttp.ServerDisconnectedError):
+            await source._request_json(url_name="ping")
+
+    # Assert
+    assert mock_get.call_count == 2
+    source._sleeps.sleep.assert_awaited_once()
+    await source.close()
+
+
+@pytest.mark.asyncio
+async def test_session_reset_once_for_concurrent_disconnects():
+    """Tests concurrent disconnected requests replace the shared session only once,
+    without cancelling the backoff of the other requests."""
+
+    # Setup
+    source = create_source(JiraDataSource)
+    source._generate_session()
+    failed_session = source.session
+    source._sleeps.cancel = Mock()
+
+    # Execute
+    with patch.object(
+        source, "_generate_session", wraps=source._generate_session
+    ) as mock_generate_session:
+        await asyncio.gather(
+            source._reset_session(session=failed_session),
+            source._reset_session(session=failed_session),
+        )
+
+    # Assert
+    mock_generate_session.assert_called_once()
+    assert failed_session.closed
+    assert source.session is not failed_session
+    source._sleeps.cancel.assert_not_called()
+    await source.close()
+
+
+@pytest.mark.parametrize("retry", [1, 3, 10])
+def test_retry_delay_is_capped_with_jitter(retry):
+    """Tests the retry delay backs off exponentially up to a cap, with jitter"""
+    # Setup
+    source = create_source(JiraDataSource)
+    delay = min(MAX_RETRY_INTERVAL, RETRY_INTERVAL**retry)
+
+    # Execute and Assert
+    assert (
+        0.5 * delay
+        <= source._retry_delay(exception=Exception(), retry=retry)
+        <= 1.5 * delay
+    )
+
+
+@pytest.mark.parametrize(
+    "headers, expected_delay",
+    [
+        ({"Retry-After": "7"}, 7),
+        ({"Retry-After": "86400"}, MAX_RETRY_AFTER),
+        ({"Retry-After": "soon"}, None),
+        ({}, None),
+    ],
+)
+def test_retry_delay_for_too_many_requests(headers, expected_delay):
+    """Tests the retry delay honors the Retry-After header of a 429 response"""
+    # Setup
+    source = create_source(JiraDataSource)
+    exception = aiohttp.ClientResponseError(
+        request_info=Mock(), history=(), status=429, headers=headers
+    )
+
+    # Execute
+    delay = source._retry_delay(exception=exception, retry=1)
+
+    # Assert
+    if expected_delay is None:
+        assert 0.5 * RETRY_INTERVAL <= delay <= 1.5 * RETRY_INTERVAL
+    else:
+        assert delay == expected_delay
+
+
 @pytest.mark.asyncio
 @patch("aiohttp.ClientSession.get")
 async def test_ping_with_ssl(mock_get, patch_logger):
     """Test ping method of JiraDataSource class with SSL"""
 
     # Execute
-    mock_get.return_value.__aenter__.return_value.status = 200
+    mock_get.return_value = MockResponse({"timeZone": "Asia/Kolkata"}, 200)
     source = create_source(JiraDataSource)
 
     source.ssl_enabled = True
@@ -217,10 +335,54 @@ async def test_ping_with_ssl(mock_get, patch_logger):
     )
 
     # Execute
-    with patch.object(ssl, "create_default_context", return_value=mock_ssl()):
-        source.ssl_ctx = ssl_context(certificate=source.certificate)
+    ssl_ctx = ssl.create_default_context()
+    with patch(
+        "connectors.sources.jira.ssl_context", return_value=ssl_ctx
+    ) as mocked_ssl_context:
         await source.ping()
 
+    # Assert
+    mocked_ssl_context.assert_called_once_with(certificate=source.certificate)
+    assert source.ssl_ctx is ssl_ctx
+    assert source.timezone == "Asia/Kolkata"
+    await source.close()
+
+
+@pytest.mark.asyncio
+async def test_ssl_context_built_once_across_sessions(patch_logger):
+    """Test the SSL context is reused when the session is generated again"""
+    # Setup
+    source = create_source(JiraDataSource)
+    source.ssl_enabled = True
+
+    # Execute
+    with patch(
+        "connectors.sources.jira.ssl_context", return_value=ssl.create_default_context()
+    ) as mocked_ssl_context:
+        source._generate_session()
+        await source.close()
+        source._generate_session()
+
+    # Assert
+    mocked_ssl_context.assert_called_once()
+    await source.close()
+
+
+@pytest.mark.asyncio
+async def test_ping_without_timezone(patch_logger):
+    """Tests ping succeeds when the user timezone is not returned by Jira"""
+
+    # Setup
+    source = create_source(JiraDataSource)
+
+    # Execute
+    with patch.object(JiraDataSource, "_request_json", return_value={}):
+        await source.ping()
+
+    # Assert
+    assert source.timezone is None
+    await source.close()
+
 
 @pytest.mark.asyncio
 @patch("aiohttp.ClientSession.get")
@@ -232,7 +394,7 @@ async def test_ping_for_failed_connection_exception(patch_logger):
 
     # Execute
     with patch.object(
-        JiraDataSource, "_api_call", side_effect=Exception("Something went wrong")
+        JiraDataSource, "_request_json", side_effect=Exception("Something went wrong")
     ):
         with pytest.raises(Exception):
             await source.ping()
@@ -276,6 +438,29 @@ def test_tweak_bulk_options():
     source.tweak_bulk_options(options)
 
 
+@pytest.mark.asyncio
+async def test_generate_session_reuses_connections():
+    """Test that the generated session pools connections up to the concurrent downloads"""
+
+    # Setup
+    source = create_source(JiraDataSource)
+    source.concurrent_downloads = 10
+
+    # Execute
+    source._generate_session()
+
+    # Assert
+    assert source.session.connector.limit == 10
+    assert source.session.connector.limit_per_host == 10
+    assert source.session.headers["accept-encoding"] == "gzip, deflate"
+    assert (
+        source.session.headers["authorization"]
+        == aiohttp.BasicAuth(login="me@example.com", password="abc#123").encode()
+    )
+    assert source.session.auth is None
+    await source.close()
+
+
 @pytest.mark.asyncio
 async def test_close():
     """Test close method for closing the unclosed session"""
@@ -319,6 +504,30 @@ async def test_get_projects(patch_logger):
             assert response == excepted_project_response
 
 
+@pytest.mark.asyncio
+async def test_get_projects_reuses_timezone_from_ping(patch_logger):
+    """Test _get_projects doesn't fetch the timezone again once ping got it"""
+    # Setup
+    source = create_source(JiraDataSource)
+    source.timezone = "Asia/Kolkata"
+    async_project_response = MockResponse(
+        [{"name": "dummy_project", "id": "test123"}], 200
+    )
+
+    # Execute
+    with patch(
+        "aiohttp.ClientSession.get", side_effect=[async_project_response]
+    ) as mock_get:
+        source._generate_session()
+        projects = [project async for project in source._get_projects()]
+    await source.close()
+
+    # Assert
+    assert len(projects) == 1
+    assert projects[0]["_id"] == "dummy_project-test123"
+    mock_get.assert_called_once()
+
+
 @pytest.mark.asyncio
 async def test_get_issues(patch_logger):
     """Test _get_issues method"""
@@ -342,6 +551,57 @@ async def test_get_issues(patch_logger):
             assert expected_response == issue_data
 
 
+@pytest.mark.asyncio
+async def test_get_issues_keeps_page_order(patch_logger):
+    """Test _get_issues yields the issues of a page in order although they are fetched concurrently"""
+    # Setup
+    source = create_source(JiraDataSource)
+    keys = ["TP-1", "TP-2", "TP-3"]
+
+    async def _paginated_api_call(url_name):
+        yield {"issues": [{"key": key} for key in keys], "total": 3}
+
+    async def _get_issue(issue_key):
+        await asyncio.sleep(0.01 if issue_key == "TP-1" else 0)
+        return {
+            "key": issue_key,
+            "fields": {
+                "project": {"name": "test_project"},
+                "updated": "2023-02-01:01:02:20",
+                "issuetype": {"name": "Task"},
+            },
+        }
+
+    # Execute
+    with patch.object(
+        source, "_paginated_api_call", side_effect=_paginated_api_call
+    ), patch.object(source, "_get_issue", side_effect=_get_issue):
+        issues = [issue["key"] async for _, issue in source._get_issues()]
+
+    # Assert
+    assert issues == keys
+
+
+@pytest.mark.asyncio
+async def test_paginated_api_call_prefetches_pages_in_order(patch_logger):
+    """Test _paginated_api_call fetches the pages after the first one ahead and in order"""
+    # Setup
+    source = create_source(JiraDataSource)
+    source.concurrent_downloads = 2
+
+    async def _get_page(url_name, start_at):
+        await asyncio.sleep(0.01 if start_at == 100 else 0)
+        return {"start_at": start_at, "total": 350}
+
+    # Execute
+    with patch.object(source, "_get_page", side_effect=_get_page) as get_page:
+        pages = [page["start_at"] async for page in source._paginated_api_call(ISSUES)]
+
+    # Assert
+    assert pages == [0, 100, 200, 300]
+    assert get_page.call_count == 4
+
+
 @pytest.mark.asyncio
 async def test_get_attachments_positive(patch_logger):
     """Test _get_attachments method"""
@@ -395,7 +655,7 @@ async def test_get_content(patch_logger):
     with mock.patch("aiohttp.ClientSession.get", return_value=async_response):
         source._generate_session()
         with mock.patch(
-            "aiohttp.StreamReader.iter_chunked",
+            "aiohttp.StreamReader.iter_any",
             return_value=AsyncIter(bytes(RESPONSE_CONTENT, "utf-8")),
         ):
             response = await source.get_content(
@@ -406,6 +666,96 @@ async def test_get_content(patch_logger):
             assert response == EXPECTED_CONTENT
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filename", ["screenshot.png", "thumbnail.jpg", "icon.gif"])
+async def test_get_content_skips_images_without_downloading(filename, patch_logger):
+    """Tests the get content method doesn't download image attachments."""
+    # Setup
+    source = create_source(JiraDataSource)
+    attachment = {
+        "id": "att3637249",
+        "created": "2023-01-03T09:24:50.633Z",
+        "filename": filename,
+        "mimeType": "image/png",
+        "size": 2048,
+    }
+
+    # Execute
+    with patch.object(source, "_api_call") as api_call:
+        response = await source.get_content(
+            issue_key="TP-1", attachment=attachment, doit=True
+        )
+
+    # Assert
+    assert response is None
+    api_call.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size, read_at_once", [(230, True), (600 * 1024, False)])
+async def test_get_content_reads_small_attachments_at_once(
+    size, read_at_once, patch_logger
+):
+    """Tests the get content method only streams the body of large attachments."""
+    # Setup
+    source = create_source(JiraDataSource)
+    attachment = {
+        "id": "att3637249",
+        "created": "2023-01-03T09:24:50.633Z",
+        "filename": "demo.py",
+        "size": size,
+    }
+    async_response = MockObjectResponse()
+
+    # Execute
+    with mock.patch("aiohttp.ClientSession.get", return_value=async_response), patch(
+        "aiohttp.StreamReader.iter_any",
+        return_value=AsyncIter(bytes("# This is the dummy file", "utf-8")),
+    ), patch.object(
+        MockObjectResponse, "read", side_effect=async_response.read
+    ) as read:
+        source._generate_session()
+        response = await source.get_content(
+            issue_key="TP-1", attachment=attachment, doit=True
+        )
+    await source.close()
+
+    # Assert
+    assert response["_attachment"] == "IyBUaGlzIGlzIHRoZSBkdW1teSBmaWxl"
+    assert read.called is read_at_once
+
+
+@pytest.mark.asyncio
+async def test_get_content_downloads_within_semaphore(patch_logger):
+    """Tests the get content method holds a request slot while downloading."""
+    # Setup
+    source = create_source(JiraDataSource)
+    source._sem = asyncio.Semaphore(1)
+    attachment = {
+        "id": "att3637249",
+        "created": "2023-01-03T09:24:50.633Z",
+        "filename": "demo.py",
+        "size": 230,
+    }
+
+    def _get(url):
+        assert source._sem.locked()
+        return MockObjectResponse()
+
+    # Execute and Assert
+    with patch("aiohttp.ClientSession.get", side_effect=_get), patch(
+        "aiohttp.StreamReader.iter_any", return_value=AsyncIter(b"content")
+    ):
+        source._generate_session()
+        response = await source.get_content(
+            issue_key="TP-1", attachment=attachment, doit=True
+        )
+    await source.close()
+
+    assert response["_id"] == "TP-1-att3637249"
+    assert not source._sem.locked()
+
+
 @pytest.mark.asyncio
 async def test_get_content_when_filesize_is_large(patch_logger):
     """Tests the get content method for file size greater than max limit."""
@@ -440,6 +790,34 @@ async def test_get_content_when_filesize_is_large(patch_logger):
             assert response is None
 
 
+@pytest.mark.asyncio
+async def test_get_content_when_downloaded_content_is_large(patch_logger):
+    """Tests the get content method discards content larger than the max limit once downloaded."""
+    # Setup
+    source = create_source(JiraDataSource)
+    attachment = {
+        "id": "att3637249",
+        "created": "2023-01-03T09:24:50.633Z",
+        "filename": "demo.py",
+        "size": 5,
+    }
+
+    # Execute and Assert
+    with patch("connectors.sources.jira.FILE_SIZE_LIMIT", 10), mock.patch(
+        "aiohttp.ClientSession.get", return_value=MockObjectResponse()
+    ), mock.patch(
+        "aiohttp.StreamReader.iter_any",
+        return_value=AsyncIter(bytes("# This is the dummy file", "utf-8")),
+    ):
+        source._generate_session()
+        response = await source.get_content(
+            issue_key="TP-1", attachment=attachment, doit=True
+        )
+
+    assert response is None
+    await source.close()
+
+
 @pytest.mark.asyncio
 async def test_get_content_for_unsupported_filetype(patch_logger):
     """Tests the get content method for file type is not supported."""
@@ -488,7 +866,13 @@ async def test_grab_content(patch_logger):
                 ]
             },
         },
-        {"id": "test_1234", "filename": "test_file.txt", "size": 200},
+        {
+            "id": "test_1234",
+            "filename": "test_file.txt",
+            "size": 200,
+            "created": "2023-01-03T09:24:50.633Z",
+            "author": {"name": "admin"},
+        },
     )
     source._get_attachments = Mock(return_value=AsyncIter(issue_data))
     source.get_content = Mock(return_value={"id": "123"})
@@ -496,6 +880,15 @@ async def test_grab_content(patch_logger):
     # Execute
     await source._grab_content("TP-1", issue_data[0])
 
+    # Assert
+    _, (_, get_content) = await source.queue.get()
+    assert get_content.keywords["attachment"] == {
+        "id": "test_1234",
+        "filename": "test_file.txt",
+        "size": 200,
+        "created": "2023-01-03T09:24:50.633Z",
+    }
+
 
 @pytest.mark.asyncio
 async def test_get_docs():
@@ -597,3 +990,52 @@ async def test_get_docs():
         documents.append(item)
 
     assert documents == expected_docs
+
+
+@pytest.mark.asyncio
+async def test_get_docs_when_producer_fails():
+    """Test get_docs raises the producer exception instead of waiting forever"""
+    # Setup
+    source = create_source(JiraDataSource)
+    source._get_projects = Mock(return_value=AsyncIter(MOCK_PROJECT))
+    source._get_issues = Mock(side_effect=Exception("Something went wrong"))
+
+    # Execute and Assert
+    with pytest.raises(Exception, match="Something went wrong"):
+        async for _ in source.get_docs():
+            pass
+    await source.close()
+
+
+@pytest.mark.asyncio
+async def test_get_docs_cancels_attachment_tasks_when_issues_fail():
+    """Test get_docs cancels the pending attachment tasks when listing issues fails"""
+    # Setup
+    source = create_source(JiraDataSource)
+    source._get_projects = Mock(return_value=AsyncIter(MOCK_PROJECT))
+    grab_content_cancelled = asyncio.Event()
+
+    async def _get_issues():
+        yield {"_id": "test_project-1234"}, {
+            "key": "TP-1234",
+            "fields": {"attachment": [{"id": "test_1"}]},
+        }
+        await asyncio.sleep(0)
+        raise Exception("Something went wrong")
+
+    async def _grab_content(attachments, issue_key):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            grab_content_cancelled.set()
+            raise
+
+    source._get_issues = _get_issues
+    source._grab_content = _grab_content
+
+    # Execute and Assert
+    with pytest.raises(Exception, match="Something went wrong"):
+        async for _ in source.get_docs():
+            pass
+    await asyncio.wait_for(grab_content_cancelled.wait(), timeout=1)
+    await source.close()
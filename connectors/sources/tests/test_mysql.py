@@ -3,8 +3,11 @@
 # or more contributor license agreements. Licensed under the Elastic License 2.0;
 # you may not use this file except in compliance with the Elastic License 2.0.
 #
-import asyncio
 import ssl
+from collections import deque
+from functools import lru_cache
+from itertools import chain
+from types import MappingProxyType, SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
 import aiomysql
@@ -14,12 +17,12 @@ from connectors.byoc import Filter
 from connectors.filtering.validation import SyncRuleValidationResult
 from connectors.source import DataSourceConfiguration
 from connectors.sources.mysql import (
+    DEFAULT_FETCH_SIZE,
     MySQLAdvancedRulesValidator,
     MySqlDataSource,
     NoDatabaseConfiguredError,
 )
-from connectors.sources.tests.support import create_source
-from connectors.tests.commons import AsyncIterator
+from connectors.utils import CancellableSleeps
 
 
 def immutable_doc(**kwargs):
@@ -56,20 +59,73 @@ ONLY_DOC_ONE = "only_doc_one"
 ACCESSIBLE = "accessible"
 INACCESSIBLE = "inaccessible"
 
-MYSQL = {
-    TABLE_ONE: {
-        TABLE_ONE_QUERY_ALL: [DOC_ONE, DOC_TWO],
-        TABLE_ONE_QUERY_DOC_ONE: [DOC_ONE],
-    },
-    TABLE_TWO: {TABLE_TWO_QUERY_ALL: [DOC_THREE, DOC_FOUR]},
+MYSQL = MappingProxyType(
+    {
+        TABLE_ONE: {
+            TABLE_ONE_QUERY_ALL: (DOC_ONE, DOC_TWO),
+            TABLE_ONE_QUERY_DOC_ONE: (DOC_ONE,),
+        },
+        TABLE_TWO: {TABLE_TWO_QUERY_ALL: (DOC_THREE, DOC_FOUR)},
+    }
+)
+
+DOCS_BY_TABLE_AND_QUERY = {
+    (table, query): docs
+    for table, queries in MYSQL.items()
+    for query, docs in queries.items()
 }
 
 
+@lru_cache(maxsize=1)
+def default_configuration():
+    return MySqlDataSource.get_default_configuration()
+
+
+def create_mysql_source():
+    # DataSourceConfiguration only reads the raw dict, so a shallow copy of the
+    # cached default configuration is enough to keep sources independent
+    return MySqlDataSource(
+        configuration=DataSourceConfiguration(dict(default_configuration()))
+    )
+
+
+class Resolved:
+    """Awaitable that is already done, cheaper than a resolved asyncio.Future"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __await__(self):
+        yield from ()
+        return self.value
+
+
 def future_with_result(result):
-    future = asyncio.Future()
-    future.set_result(result)
+    return Resolved(result)
+
+
+class FastAsyncIterator:
+    """Async iterator over a fixed sequence of items, without call recording"""
+
+    __slots__ = ("_it",)
+
+    def __init__(self, items):
+        self._it = iter(items)
+
+    def __aiter__(self):
+        return self
 
-    return future
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+
+async def _noop_async(*args, **kwargs):
+    pass
 
 
 @pytest.fixture
@@ -92,20 +148,30 @@ def patch_fetch_rows_for_table():
         yield mock_to_patch
 
 
-@pytest.fixture
-def patch_default_wait_multiplier():
-    with patch("connectors.sources.mysql.RETRY_INTERVAL", 0):
+@pytest.fixture(autouse=True, scope="module")
+def fast_retries():
+    with patch("connectors.sources.mysql.RETRY_INTERVAL", 0), patch.object(
+        CancellableSleeps, "sleep", _noop_async
+    ):
         yield
 
 
+@pytest.fixture(scope="module")
+def _connection_pool_template():
+    return SimpleNamespace(close=lambda: None, wait_closed=_noop_async)
+
+
 @pytest.fixture
-def patch_connection_pool():
-    connection_pool = Mock()
-    connection_pool.close = Mock()
-    connection_pool.wait_closed = AsyncMock()
-    connection_pool.acquire = Mock(return_value=Connection())
-    connection_pool.acquire.__aenter__ = AsyncMock()
-    connection_pool.acquire.__aexit__ = AsyncMock()
+def mysql_pool(request, _connection_pool_template):
+    """Shared mock pool handed out by a patched aiomysql.create_pool.
+
+    Parametrize it indirectly with Connection keyword arguments, e.g.
+    {"is_connection_lost": True}.
+    """
+    connection_pool = _connection_pool_template
+    connection_pool.acquire = Mock(
+        return_value=Connection(**getattr(request, "param", {}))
+    )
 
     with patch(
         "aiomysql.create_pool",
@@ -124,12 +190,16 @@ def test_get_configuration():
     assert config["port"] == 3306
 
 
+# aiomysql hands rows back as tuples of column values
+ROWS = (("table1",), ("table2",))
+
+
 class Result:
     """This class contains method which returns dummy response"""
 
     def result(self):
         """Result method which returns dummy result"""
-        return [["table1"], ["table2"]]
+        return ROWS
 
 
 class Cursor:
@@ -139,33 +209,31 @@ class Cursor:
         """Make a dummy database connection and return it"""
         return self
 
-    def __init__(self, *args, **kw):
-        self.first_call = True
-        self.description = [["Database"]]
+    def __init__(self, *args, rows=None, is_connection_lost=False, **kw):
+        self.description = (("Database",),)
+        self.rows = deque(ROWS if rows is None else rows)
+        self.is_connection_lost = is_connection_lost
+        self.fetch_sizes = []
 
     def fetchall(self):
         """This method returns object of Return class"""
-        futures_object = asyncio.Future()
-        futures_object.set_result([["table1"], ["table2"]])
-        return futures_object
+        return Resolved(ROWS)
 
     async def fetchmany(self, size=1):
-        """This method returns response of fetchmany"""
-        if self.first_call:
-            self.first_call = False
-            return [["table1"], ["table2"]]
-        if self.is_connection_lost:
-            raise Exception("Incomplete Read Error")
-        return []
+        """This method returns the next batch of at most size rows"""
+        self.fetch_sizes.append(size)
+        if not self.rows:
+            if self.is_connection_lost:
+                raise Exception("Incomplete Read Error")
+            return []
+        return [self.rows.popleft() for _ in range(min(size, len(self.rows)))]
 
     async def scroll(self, *args, **kw):
         raise Exception("Incomplete Read Error")
 
     def execute(self, query):
         """This method returns future object"""
-        futures_object = asyncio.Future()
-        futures_object.set_result(MagicMock())
-        return futures_object
+        return Resolved(MagicMock())
 
     async def __aexit__(self, exception_type, exception_value, exception_traceback):
         """Make sure the dummy database connection gets closed"""
@@ -175,6 +243,11 @@ class Cursor:
 class Connection:
     """This class contains methods which returns dummy connection response"""
 
+    def __init__(self, rows=None, is_connection_lost=False):
+        self.rows = rows
+        self.is_connection_lost = is_connection_lost
+        self.cursors = []
+
     async def __aenter__(self):
         """Make a dummy database connection and return it"""
         return self
@@ -183,9 +256,11 @@ class Connection:
         """This method returns object of Result class"""
         return True
 
-    async def cursor(self):
-        """This method returns object of Result class"""
-        return Cursor
+    def cursor(self, *args, **kw):
+        """This method returns a fresh Cursor object"""
+        cursor = Cursor(rows=self.rows, is_connection_lost=self.is_connection_lost)
+        self.cursors.append(cursor)
+        return cursor
 
     async def __aexit__(self, exception_type, exception_value, exception_traceback):
         """Make sure the dummy database connection gets closed"""
@@ -200,38 +275,25 @@ class MockSsl:
         pass
 
 
-async def mock_mysql_response():
-    """Creates mock response
+MOCK_SSL = MockSsl()
 
-    Returns:
-        Mock Object: Mock response
-    """
-    mock_response = asyncio.Future()
-    mock_response.set_result(MagicMock())
-
-    return mock_response
 
-
-@pytest.mark.asyncio
 async def test_close_when_source_setup_correctly_does_not_raise_errors():
-    source = create_source(MySqlDataSource)
+    source = create_mysql_source()
 
     await source.close()
 
 
-@pytest.mark.asyncio
-async def test_ping(patch_logger, patch_connection_pool):
+async def test_ping(patch_logger, mysql_pool):
     source = await setup_mysql_source(MySqlDataSource)
 
     await source.ping()
 
 
-@pytest.mark.asyncio
 async def test_ping_negative(patch_logger):
-    source = create_source(MySqlDataSource)
+    source = create_mysql_source()
 
-    mock_response = asyncio.Future()
-    mock_response.set_result(Mock())
+    mock_response = Resolved(Mock())
 
     source.connection_pool = await mock_response
 
@@ -240,32 +302,60 @@ async def test_ping_negative(patch_logger):
             await source.ping()
 
 
-@pytest.mark.asyncio
-async def test_connect_with_retry(
-    patch_logger, patch_connection_pool, patch_default_wait_multiplier
-):
-    source = await setup_mysql_source(is_connection_lost=True)
+@pytest.mark.parametrize(
+    "mysql_pool", [{"is_connection_lost": True}], indirect=True, ids=["lost"]
+)
+async def test_connect_with_retry(patch_logger, mysql_pool):
+    source = await setup_mysql_source()
 
-    streamer = source._connect(query="select * from database.table", fetch_many=True)
+    streamer = source._connect(
+        query="select * from database.table", fetch_many=True, table="table"
+    )
 
-    with pytest.raises(Exception):
+    with pytest.raises(Exception, match="Incomplete Read Error"):
         async for _ in streamer:
             pass
 
 
-@pytest.mark.asyncio
-async def test_fetch_documents(patch_connection_pool):
+@pytest.mark.parametrize(
+    "mysql_pool", [{"rows": (("row",),) * 250}], indirect=True, ids=["250_rows"]
+)
+@pytest.mark.parametrize("fetch_size", [1, 10, 100])
+async def test_connect_fetches_rows_in_batches_of_fetch_size(mysql_pool, fetch_size):
+    connection = mysql_pool.acquire.return_value
     source = await setup_mysql_source(DATABASE)
+    source.configuration.set_field(name="fetch_size", value=fetch_size, type="int")
+
+    rows = [
+        row
+        async for row in source._connect(
+            query="select * from database.table", fetch_many=True, table="table"
+        )
+    ]
 
-    query = "select * from table"
+    assert len(rows) == 1 + 250
+    assert set(connection.cursors[0].fetch_sizes) == {fetch_size}
 
-    response = source._connect(query)
 
-    patch("source._connect", return_value=response)
+async def test_connect_fetches_rows_in_batches_by_default(mysql_pool):
+    connection = mysql_pool.acquire.return_value
+    source = await setup_mysql_source(DATABASE)
 
-    document_list = []
-    async for document in source.fetch_documents(table="table_name"):
-        document_list.append(document)
+    async for _ in source._connect(
+        query="select * from database.table", fetch_many=True, table="table"
+    ):
+        pass
+
+    assert DEFAULT_FETCH_SIZE > 1
+    assert set(connection.cursors[0].fetch_sizes) == {DEFAULT_FETCH_SIZE}
+
+
+async def test_fetch_documents(mysql_pool):
+    source = await setup_mysql_source(DATABASE)
+
+    document_list = [
+        document async for document in source.fetch_documents(table="table_name")
+    ]
 
     assert {
         "Database": f"{DATABASE}",
@@ -276,21 +366,14 @@ async def test_fetch_documents(patch_connection_pool):
     } in document_list
 
 
-@pytest.mark.asyncio
-async def test_fetch_rows_from_tables(patch_connection_pool):
+async def test_fetch_rows_from_tables(mysql_pool):
     source = await setup_mysql_source()
 
-    query = "select * from table"
+    rows = [row async for row in source.fetch_rows_from_tables("table")]
 
-    response = source._connect(query)
+    assert all("_id" in row for row in rows)
 
-    patch("source._connect", return_value=response)
 
-    async for row in source.fetch_rows_from_tables("table"):
-        assert "_id" in row
-
-
-@pytest.mark.asyncio
 async def test_get_docs_with_empty_db_fields_raises_error():
     source = await setup_mysql_source("")
 
@@ -299,44 +382,36 @@ async def test_get_docs_with_empty_db_fields_raises_error():
             pass
 
 
-@pytest.mark.asyncio
-async def test_get_docs(patch_connection_pool):
+async def test_get_docs(mysql_pool):
     source = await setup_mysql_source(DATABASE)
 
-    source.fetch_rows_from_tables = MagicMock(
-        return_value=AsyncIterator([{"a": 1, "b": 2}])
+    source.fetch_rows_from_tables = lambda *args, **kw: FastAsyncIterator(
+        ({"a": 1, "b": 2},)
     )
 
-    async for doc, _ in source.get_docs():
-        assert doc == {"a": 1, "b": 2}
+    docs = [doc async for doc, _ in source.get_docs()]
+
+    assert docs == [{"a": 1, "b": 2}]
 
 
-async def setup_mysql_source(database="", is_connection_lost=False):
-    source = create_source(MySqlDataSource)
+async def setup_mysql_source(database=""):
+    source = create_mysql_source()
     source.configuration.set_field(
         name="database", label="Database", value=database, type="str"
     )
 
     source.database = database
 
-    connection_pool = await mock_mysql_response()
-    connection_pool.acquire = Connection
-    connection_pool.acquire.cursor = Cursor
-    connection_pool.acquire.cursor.is_connection_lost = is_connection_lost
-
-    patch.object(source, "_get_connection_pool", connection_pool)
-
     return source
 
 
 def setup_available_docs(advanced_snippet):
-    available_docs = []
-
-    for table in advanced_snippet:
-        query = advanced_snippet[table]
-        available_docs += MYSQL[table][query]
-
-    return available_docs
+    return tuple(
+        chain.from_iterable(
+            DOCS_BY_TABLE_AND_QUERY[(table, query)]
+            for table, query in advanced_snippet.items()
+        )
+    )
 
 
 @pytest.mark.parametrize(
@@ -375,47 +450,48 @@ def setup_available_docs(advanced_snippet):
             {DOC_ONE, DOC_THREE, DOC_FOUR},
         ),
     ],
+    ids=[
+        "single_table_multiple_docs",
+        "single_table_single_doc",
+        "multiple_tables_multiple_docs",
+    ],
 )
-@pytest.mark.asyncio
 async def test_get_docs_with_advanced_rules(
     filtering, expected_docs, patch_fetch_rows_for_table
 ):
     source = await setup_mysql_source(DATABASE)
     docs_in_db = setup_available_docs(filtering.get_advanced_rules())
-    patch_fetch_rows_for_table.return_value = AsyncIterator(docs_in_db)
+    patch_fetch_rows_for_table.return_value = FastAsyncIterator(docs_in_db)
 
-    yielded_docs = set()
-    async for doc, _ in source.get_docs(filtering):
-        yielded_docs.add(doc)
+    yielded_docs = {doc async for doc, _ in source.get_docs(filtering)}
 
     assert yielded_docs == expected_docs
 
 
-def test_validate_configuration():
-    """This function test _validate_configuration method of MySQL"""
-    source = create_source(MySqlDataSource)
-    source.configuration.set_field(name="host", value="")
-
-    with pytest.raises(Exception):
-        source._validate_configuration()
-
-
-def test_validate_configuration_with_port():
-    """This function test _validate_configuration method with port str input of MySQL"""
-    source = create_source(MySqlDataSource)
-    source.configuration.set_field(name="port", value="port")
+@pytest.mark.parametrize(
+    "field, value, message",
+    [
+        ("host", "", "can't be empty"),
+        ("port", "port", "has to be an integer"),
+    ],
+    ids=["empty_host", "non_numeric_port"],
+)
+async def test_validate_config_with_invalid_field_raises_error(field, value, message):
+    """This function test validate_config method of MySQL with an empty host or a non-numeric port"""
+    source = create_mysql_source()
+    source.configuration.set_field(name=field, value=value)
 
-    with pytest.raises(Exception):
-        source._validate_configuration()
+    with pytest.raises(Exception, match=message):
+        await source.validate_config()
 
 
-def test_ssl_context():
+def test_ssl_context(monkeypatch):
     """This function test _ssl_context with dummy certificate"""
     certificate = "-----BEGIN CERTIFICATE----- Certificate -----END CERTIFICATE-----"
-    source = create_source(MySqlDataSource)
+    source = create_mysql_source()
+    monkeypatch.setattr(ssl, "create_default_context", lambda *args, **kw: MOCK_SSL)
 
-    with patch.object(ssl, "create_default_context", return_value=MockSsl()):
-        source._ssl_context(certificate=certificate)
+    assert source._ssl_context(certificate=certificate) is MOCK_SSL
 
 
 @pytest.mark.parametrize(
@@ -461,8 +537,14 @@ def test_ssl_context():
             ),
         ),
     ],
+    ids=[
+        "no_tables",
+        "single_table_present",
+        "multiple_tables_present",
+        "single_table_missing",
+        "multiple_tables_missing",
+    ],
 )
-@pytest.mark.asyncio
 async def test_advanced_rules_tables_validation(
     datasource,
     advanced_rules,
@@ -474,7 +556,7 @@ async def test_advanced_rules_tables_validation(
         map(lambda table: (table, None), datasource.keys())
     ]
 
-    source = create_source(MySqlDataSource)
+    source = create_mysql_source()
     validation_result = await MySQLAdvancedRulesValidator(source).validate(
         advanced_rules
     )
@@ -482,10 +564,9 @@ async def test_advanced_rules_tables_validation(
     assert validation_result == expected_validation_result
 
 
-@pytest.mark.parametrize("tables", ["*", ["*"]])
-@pytest.mark.asyncio
+@pytest.mark.parametrize("tables", ["*", ["*"]], ids=["wildcard", "wildcard_list"])
 async def test_get_tables_to_fetch_remote_tables(tables):
-    source = create_source(MySqlDataSource)
+    source = create_mysql_source()
     source.fetch_all_tables = AsyncMock(return_value="table")
 
     await source.get_tables_to_fetch()
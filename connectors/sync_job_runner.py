@@ -128,12 +128,19 @@ class SyncJobRunner:
         doc_created = result.get("doc_created", 0)
         doc_deleted = result.get("doc_deleted", 0)
         indexed_count = doc_updated + doc_created
+        # an interrupted or failed sync may have written documents it has no
+        # stats for, only a completed sync without any change skips the refresh
+        wrote_documents = (
+            sync_status != JobStatus.COMPLETED or indexed_count > 0 or doc_deleted > 0
+        )
 
         ingestion_stats = {
             "indexed_document_count": indexed_count,
             "indexed_document_volume": 0,
             "deleted_document_count": doc_deleted,
-            "total_document_count": await self.connector.document_count(),
+            "total_document_count": await self.connector.document_count(
+                refresh=wrote_documents
+            ),
         }
 
         if sync_status == JobStatus.ERROR:
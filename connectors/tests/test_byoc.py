@@ -12,9 +12,12 @@ from unittest.mock import ANY, AsyncMock, Mock, patch
 import pytest
 
 from connectors.byoc import (
+    CONNECTOR_SOURCE_FIELDS,
     IDLE_JOBS_THRESHOLD,
     JOB_NOT_FOUND_ERROR,
     SYNC_DISABLED,
+    SYNC_JOB_SOURCE_FIELDS,
+    WORKER_HOSTNAME,
     Connector,
     ConnectorIndex,
     Features,
@@ -244,13 +247,19 @@ async def test_supported_connectors(
     }
 
     if len(native_service_types) > 0 and len(connector_ids) > 0:
-        query = {"bool": {"should": [native_connectors_query, custom_connectors_query]}}
+        query = {
+            "bool": {
+                "should": [native_connectors_query, custom_connectors_query],
+                "minimum_should_match": 1,
+            }
+        }
     elif len(native_service_types) > 0:
         query = native_connectors_query
     elif len(connector_ids) > 0:
         query = custom_connectors_query
     else:
         query = {}
+    query = {"constant_score": {"filter": query}}
 
     headers = {"X-Elastic-Product": "Elasticsearch"}
     mock_responses.post(
@@ -279,6 +288,54 @@ async def test_supported_connectors(
         assert connectors[0].service_type == mongo["service_type"]
 
 
+@pytest.mark.asyncio
+@patch("connectors.byoc.ConnectorIndex.get_all_docs")
+async def test_supported_connectors_query(get_all_docs):
+    config = {"host": "http://nowhere.com:9200", "user": "tarek", "password": "blah"}
+    get_all_docs.return_value = AsyncIterator([])
+    expected_query = {
+        "constant_score": {
+            "filter": {
+                "bool": {
+                    "should": [
+                        {
+                            "bool": {
+                                "filter": [
+                                    {"term": {"is_native": True}},
+                                    {"terms": {"service_type": ["mongodb"]}},
+                                ]
+                            }
+                        },
+                        {
+                            "bool": {
+                                "filter": [
+                                    {"term": {"is_native": False}},
+                                    {"terms": {"_id": ["1"]}},
+                                ]
+                            }
+                        },
+                    ],
+                    "minimum_should_match": 1,
+                }
+            }
+        }
+    }
+
+    connector_index = ConnectorIndex(config)
+    connectors = [
+        connector
+        async for connector in connector_index.supported_connectors(
+            native_service_types=["mongodb"], connector_ids=["1"]
+        )
+    ]
+    await connector_index.close()
+
+    assert len(connectors) == 0
+    get_all_docs.assert_called_with(
+        query=expected_query, source=CONNECTOR_SOURCE_FIELDS
+    )
+
+
 @pytest.mark.asyncio
 async def test_all_connectors(mock_responses):
     config = {"host": "http://nowhere.com:9200", "user": "tarek", "password": "blah"}
@@ -339,6 +396,37 @@ async def test_connector_properties():
     assert isinstance(connector.features, Features)
 
 
+@pytest.mark.asyncio
+async def test_connector_cached_properties_reset_on_reload():
+    connector_src = {
+        "_id": "test",
+        "_source": {
+            "configuration": {},
+            "pipeline": {"name": "old-pipeline"},
+        },
+    }
+    reloaded_connector_src = {
+        "_id": "test",
+        "_source": {
+            "configuration": {"key": {"value": "value"}},
+            "pipeline": {"name": "new-pipeline"},
+        },
+    }
+
+    index = Mock()
+    index.fetch_response_by_id = AsyncMock(return_value=reloaded_connector_src)
+    connector = Connector(elastic_index=index, doc_source=connector_src)
+
+    assert connector.pipeline is connector.pipeline
+    assert connector.configuration.is_empty()
+    assert connector.pipeline["name"] == "old-pipeline"
+
+    await connector.reload()
+
+    assert not connector.configuration.is_empty()
+    assert connector.pipeline["name"] == "new-pipeline"
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     "interval, last_seen, should_send_heartbeat",
@@ -371,6 +459,21 @@ async def test_heartbeat(interval, last_seen, should_send_heartbeat):
         index.heartbeat.assert_not_awaited()
 
 
+def test_connector_last_seen_is_parsed_once_per_value():
+    last_seen = datetime.now(timezone.utc)
+    source = {"_id": "1", "_source": {"last_seen": iso_utc(last_seen)}}
+
+    connector = Connector(elastic_index=Mock(), doc_source=source)
+
+    assert connector.last_seen == last_seen
+    assert connector.last_seen is connector.last_seen
+
+    newer_last_seen = last_seen + timedelta(seconds=10)
+    connector._source["last_seen"] = iso_utc(newer_last_seen)
+
+    assert connector.last_seen == newer_last_seen
+
+
 @pytest.mark.asyncio
 async def test_sync_starts():
     connector_doc = {"_id": "1"}
@@ -601,7 +704,7 @@ async def test_sync_job_claim(patch_logger):
         "status": JobStatus.IN_PROGRESS.value,
         "started_at": ANY,
         "last_seen": ANY,
-        "worker_hostname": ANY,
+        "worker_hostname": WORKER_HOSTNAME,
     }
 
     sync_job = SyncJob(elastic_index=index, doc_source=source)
@@ -664,6 +767,12 @@ async def test_sync_job_cancel(patch_logger):
     await sync_job.cancel()
 
     index.update.assert_called_with(doc_id=sync_job.id, doc=expected_doc_source_update)
+    updated_doc = index.update.call_args.kwargs["doc"]
+    assert (
+        updated_doc["last_seen"]
+        == updated_doc["completed_at"]
+        == updated_doc["canceled_at"]
+    )
 
 
 @pytest.mark.asyncio
@@ -823,6 +932,38 @@ async def test_connector_validate_filtering_valid(patch_logger):
     index.fetch_response_by_id.assert_awaited()
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("refresh", [True, False])
+async def test_connector_document_count(refresh):
+    index = Mock()
+    index.client.indices.refresh = AsyncMock()
+    index.client.count = AsyncMock(return_value={"count": 10})
+    connector = Connector(elastic_index=index, doc_source=deepcopy(DOC_SOURCE))
+
+    assert await connector.document_count(refresh=refresh) == 10
+    assert index.client.indices.refresh.await_count == (1 if refresh else 0)
+    index.client.count.assert_awaited_with(
+        index=connector.index_name, ignore_unavailable=True, preference="_local"
+    )
+
+
+@pytest.mark.asyncio
+async def test_connector_validate_filtering_does_not_mutate_doc_source(patch_logger):
+    index = Mock()
+    index.update = AsyncMock()
+    index.fetch_response_by_id = AsyncMock()
+    validator = Mock()
+    validator.validate_filtering = AsyncMock(return_value=FilteringValidationResult())
+    doc_source = deepcopy(DOC_SOURCE_WITH_EDITED_FILTERING)
+    filtering_before_validation = deepcopy(doc_source["_source"]["filtering"])
+
+    connector = Connector(elastic_index=index, doc_source=doc_source)
+    await connector.validate_filtering(validator=validator)
+
+    index.update.assert_awaited()
+    assert doc_source["_source"]["filtering"] == filtering_before_validation
+
+
 @pytest.mark.parametrize(
     "filtering_json, filter_state, domain, expected_filter",
     [
@@ -855,6 +996,18 @@ def test_get_filter(filtering_json, filter_state, domain, expected_filter):
     assert filtering.get_filter(filter_state, domain) == expected_filter
 
 
+def test_get_filter_for_missing_domain_returns_shared_empty_filter():
+    filtering = Filtering(FILTERING)
+
+    assert filtering.get_filter(domain=NON_EXISTING_DOMAIN) is filtering.get_filter(
+        domain=NON_EXISTING_DOMAIN
+    )
+
+
+def test_filter_has_no_instance_dict():
+    assert not hasattr(Filter(ACTIVE_FILTERING_DEFAULT_DOMAIN), "__dict__")
+
+
 @pytest.mark.parametrize(
     "domain, expected_filter",
     [
@@ -910,6 +1063,16 @@ def test_transform_filtering(filtering, expected_transformed_filtering):
     )
 
 
+def test_transform_filtering_does_not_share_references():
+    filter_ = Filter(filter_=ACTIVE_FILTERING_DEFAULT_DOMAIN)
+
+    transformed_filtering = filter_.transform_filtering()
+    transformed_filtering["rules"].append({"id": 5})
+
+    assert filter_["rules"] == ACTIVE_FILTERING_DEFAULT_DOMAIN["rules"]
+    assert len(filter_["rules"]) == 2
+
+
 @pytest.mark.parametrize(
     "features_json, feature_enabled",
     [
@@ -1098,6 +1261,30 @@ def test_sync_rules_enabled(features_json, sync_rules_enabled):
     assert features.sync_rules_enabled() == sync_rules_enabled
 
 
+def test_sync_rules_enabled_short_circuits():
+    features = Features({"sync_rules": {"basic": {"enabled": True}}})
+
+    with patch.object(
+        features, "feature_enabled", wraps=features.feature_enabled
+    ) as feature_enabled:
+        assert features.sync_rules_enabled()
+
+    feature_enabled.assert_called_once_with(Features.BASIC_RULES_NEW)
+
+
+def test_feature_enabled_looks_up_features_once():
+    features = Features({"sync_rules": {"advanced": {"enabled": True}}})
+
+    with patch.object(
+        features, "_nested_feature_enabled", wraps=features._nested_feature_enabled
+    ) as nested_feature_enabled:
+        for _ in range(3):
+            assert features.feature_enabled(Features.ADVANCED_RULES_NEW)
+            assert not features.feature_enabled("unknown")
+
+    nested_feature_enabled.assert_called_once()
+
+
 @pytest.mark.parametrize(
     "nested_dict, keys, default, expected",
     [
@@ -1169,7 +1356,7 @@ async def test_pending_jobs(get_all_docs, patch_logger, set_env):
     connector_ids = [1, 2]
     expected_query = {
         "bool": {
-            "must": [
+            "filter": [
                 {
                     "terms": {
                         "status": [
@@ -1188,7 +1375,9 @@ async def test_pending_jobs(get_all_docs, patch_logger, set_env):
         job async for job in sync_job_index.pending_jobs(connector_ids=connector_ids)
     ]
 
-    get_all_docs.assert_called_with(query=expected_query)
+    get_all_docs.assert_called_with(
+        query={"constant_score": {"filter": expected_query}}
+    )
     assert len(jobs) == 1
     assert jobs[0] == job
 
@@ -1200,14 +1389,21 @@ async def test_orphaned_jobs(get_all_docs, patch_logger, set_env):
     get_all_docs.return_value = AsyncIterator([job])
     config = load_config(CONFIG)
     connector_ids = [1, 2]
-    expected_query = {"bool": {"must_not": {"terms": {"connector.id": connector_ids}}}}
+    expected_query = {
+        "bool": {
+            "filter": [],
+            "must_not": {"terms": {"connector.id": connector_ids}},
+        }
+    }
 
     sync_job_index = SyncJobIndex(elastic_config=config["elasticsearch"])
     jobs = [
         job async for job in sync_job_index.orphaned_jobs(connector_ids=connector_ids)
     ]
 
-    get_all_docs.assert_called_with(query=expected_query)
+    get_all_docs.assert_called_with(
+        query={"constant_score": {"filter": expected_query}}
+    )
     assert len(jobs) == 1
     assert jobs[0] == job
 
@@ -1239,7 +1435,10 @@ async def test_idle_jobs(get_all_docs, patch_logger, set_env):
     sync_job_index = SyncJobIndex(elastic_config=config["elasticsearch"])
     jobs = [job async for job in sync_job_index.idle_jobs(connector_ids=connector_ids)]
 
-    get_all_docs.assert_called_with(query=expected_query)
+    get_all_docs.assert_called_with(
+        query={"constant_score": {"filter": expected_query}},
+        source=SYNC_JOB_SOURCE_FIELDS,
+    )
     assert len(jobs) == 1
     assert jobs[0] == job
 
@@ -1291,6 +1490,13 @@ def test_pipeline_properties(key, value, default_value):
     assert Pipeline({key: value})[key] == value
 
 
+def test_pipeline_is_a_plain_dict():
+    pipeline = Pipeline(None)
+
+    assert isinstance(pipeline, dict)
+    assert json.loads(json.dumps(pipeline)) == pipeline
+
+
 @pytest.mark.parametrize(
     "filtering, expected_advanced_rules",
     [
@@ -3,10 +3,12 @@
 # or more contributor license agreements. Licensed under the Elastic License 2.0;
 # you may not use this file except in compliance with the Elastic License 2.0.
 #
+from unittest.mock import AsyncMock
+
 import pytest
 from elasticsearch import ApiError, ConflictError
 
-from connectors.es.index import DocumentNotFoundError, ESIndex
+from connectors.es.index import DocumentNotFoundError, ESIndex, UpdateBatchError
 
 headers = {"X-Elastic-Product": "Elasticsearch"}
 config = {
@@ -182,6 +184,89 @@ async def test_update_with_concurrency_control(mock_responses):
     await index.close()
 
 
+@pytest.mark.asyncio
+async def test_queue_update_without_batch_updates_immediately():
+    doc_id = "1"
+    index = ESIndex(index_name, config)
+    index.update = AsyncMock()
+    index.client.bulk = AsyncMock()
+
+    await index.queue_update(doc_id, {"field": "value"})
+
+    index.update.assert_awaited_once_with(doc_id=doc_id, doc={"field": "value"})
+    index.client.bulk.assert_not_awaited()
+
+    await index.close()
+
+
+@pytest.mark.asyncio
+async def test_batched_updates():
+    index = ESIndex(index_name, config)
+    index.update = AsyncMock()
+    index.client.bulk = AsyncMock(return_value={"errors": False, "items": []})
+
+    async with index.batched_updates(retry_on_conflict=2) as batcher:
+        await index.queue_update("1", {"field": "value"})
+        await index.queue_update("2", {"other_field": "value"})
+
+        assert len(batcher) == 2
+        index.client.bulk.assert_not_awaited()
+
+    index.update.assert_not_awaited()
+    index.client.bulk.assert_awaited_once_with(
+        operations=[
+            {"update": {"_id": "1", "_index": index_name, "retry_on_conflict": 2}},
+            {"doc": {"field": "value"}},
+            {"update": {"_id": "2", "_index": index_name, "retry_on_conflict": 2}},
+            {"doc": {"other_field": "value"}},
+        ]
+    )
+
+    # updates go straight to Elasticsearch again once the block exits
+    await index.queue_update("1", {"field": "value"})
+    index.update.assert_awaited_once()
+
+    await index.close()
+
+
+@pytest.mark.asyncio
+async def test_batched_updates_flush_updates():
+    index = ESIndex(index_name, config)
+    index.client.bulk = AsyncMock(return_value={"errors": False, "items": []})
+
+    async with index.batched_updates():
+        await index.queue_update("1", {"field": "value"})
+        await index.flush_updates()
+
+        assert index.client.bulk.await_count == 1
+
+    # nothing left to send when the block exits
+    assert index.client.bulk.await_count == 1
+
+    await index.close()
+
+
+@pytest.mark.asyncio
+async def test_batched_updates_with_failed_update(patch_logger):
+    index = ESIndex(index_name, config)
+    index.client.bulk = AsyncMock(
+        return_value={
+            "errors": True,
+            "items": [
+                {"update": {"_id": "1", "status": 200}},
+                {"update": {"_id": "2", "status": 404, "error": "not found"}},
+            ],
+        }
+    )
+
+    with pytest.raises(UpdateBatchError):
+        async with index.batched_updates():
+            await index.queue_update("1", {"field": "value"})
+            await index.queue_update("2", {"field": "value"})
+
+    await index.close()
+
+
 @pytest.mark.asyncio
 async def test_get_all_docs_with_error(mock_responses):
     index = FakeIndex(index_name, config)
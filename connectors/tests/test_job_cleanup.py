@@ -83,7 +83,6 @@ async def test_cleanup_jobs(
 
     all_connectors.return_value = AsyncIterator([connector])
     supported_connectors.return_value = AsyncIterator([connector])
-    connector_fetch_by_id.return_value = connector
     orphaned_jobs.return_value = AsyncIterator([sync_job, another_sync_job])
     idle_jobs.return_value = AsyncIterator([sync_job])
     delete_jobs.return_value = {"deleted": 1, "failures": [], "total": 1}
@@ -95,3 +94,5 @@ async def test_cleanup_jobs(
     delete_jobs.assert_called_with(job_ids=[sync_job.id, another_sync_job.id])
     sync_job.fail.assert_called_with(message=IDLE_JOB_ERROR)
     connector.sync_done.assert_called_with(job=sync_job)
+    # the connectors returned by supported_connectors are reused
+    connector_fetch_by_id.assert_not_called()
@@ -5,12 +5,14 @@
 #
 import asyncio
 import os
-from unittest.mock import AsyncMock, Mock, patch
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
 import pytest
 
 from connectors.byoc import (
     SYNC_DISABLED,
+    Connector,
+    ConnectorIndex,
     ConnectorUpdateError,
     DataSourceError,
     JobStatus,
@@ -67,6 +69,8 @@ def connector_index_mock():
         connector_index_mock = Mock()
         connector_index_mock.stop_waiting = Mock()
         connector_index_mock.close = AsyncMock()
+        connector_index_mock.batched_updates = MagicMock()
+        connector_index_mock.flush_updates = AsyncMock()
         connector_index_klass_mock.return_value = connector_index_mock
 
         yield connector_index_mock
@@ -169,6 +173,48 @@ async def test_connector_sync_now(
     concurrent_tasks_mock.put.assert_awaited_once_with(sync_job_runner_mock.execute)
 
 
+@pytest.mark.asyncio
+async def test_connector_updates_flushed_before_sync_is_queued(
+    concurrent_tasks_mock, patch_logger, set_env
+):
+    calls = []
+    connector_index = ConnectorIndex(load_config(CONFIG_FILE)["elasticsearch"])
+    connector_index.client.update = AsyncMock()
+
+    async def _bulk(operations):
+        calls.append(("bulk", operations))
+        return {"errors": False, "items": []}
+
+    async def _put(coroutine):
+        calls.append(("put", coroutine))
+
+    connector_index.client.bulk = AsyncMock(side_effect=_bulk)
+    concurrent_tasks_mock.put.side_effect = _put
+
+    connector = mock_connector(sync_now=True, next_sync=0)
+    connector.id = "1"
+    connector.index = connector_index
+    connector.last_seen = None
+    # the connector updates go through the real index
+    connector.heartbeat = lambda interval: Connector.heartbeat(connector, interval)
+    connector.reset_sync_now_flag = lambda: Connector.reset_sync_now_flag(connector)
+    connector_index.supported_connectors = Mock(
+        return_value=AsyncIterator([connector])
+    )
+
+    with patch(
+        "connectors.services.job_scheduling.ConnectorIndex",
+        return_value=connector_index,
+    ):
+        await create_and_run_service()
+
+    connector_index.client.update.assert_not_awaited()
+    assert [call for call, _ in calls] == ["bulk", "put"]
+    updated_docs = [operation.get("doc") for operation in calls[0][1]]
+    assert "last_seen" in updated_docs[1]
+    assert updated_docs[3] == {"sync_now": False}
+
+
 @pytest.mark.asyncio
 async def test_connector_with_suspended_job(
     connector_index_mock,
@@ -123,6 +123,7 @@ async def test_source_not_changed(patch_logger):
     sync_job_runner.sync_job.cancel.assert_not_awaited()
     sync_job_runner.sync_job.suspend.assert_not_awaited()
     sync_job_runner.connector.sync_done.assert_awaited_with(sync_job_runner.sync_job)
+    sync_job_runner.connector.document_count.assert_awaited_with(refresh=False)
 
 
 @pytest.mark.asyncio
@@ -222,6 +223,7 @@ async def test_async_bulk_error(patch_logger):
     sync_job_runner.sync_job.cancel.assert_not_awaited()
     sync_job_runner.sync_job.suspend.assert_not_awaited()
     sync_job_runner.connector.sync_done.assert_awaited_with(sync_job_runner.sync_job)
+    sync_job_runner.connector.document_count.assert_awaited_with(refresh=True)
 
 
 @pytest.mark.asyncio
@@ -252,6 +254,7 @@ async def test_sync_job_runner(patch_logger):
     sync_job_runner.sync_job.cancel.assert_not_awaited()
     sync_job_runner.sync_job.suspend.assert_not_awaited()
     sync_job_runner.connector.sync_done.assert_awaited_with(sync_job_runner.sync_job)
+    sync_job_runner.connector.document_count.assert_awaited_with(refresh=True)
 
 
 @pytest.mark.asyncio
@@ -280,6 +283,7 @@ async def test_sync_job_runner_suspend(patch_logger):
     sync_job_runner.sync_job.done.assert_not_awaited()
     sync_job_runner.sync_job.fail.assert_not_awaited()
     sync_job_runner.sync_job.cancel.assert_not_awaited()
+    sync_job_runner.connector.document_count.assert_awaited_with(refresh=True)
     sync_job_runner.sync_job.suspend.assert_awaited_with(
         ingestion_stats=ingestion_stats
     )
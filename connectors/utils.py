@@ -29,29 +29,31 @@ DEFAULT_QUEUE_MEM_SIZE = 5
 DEFAULT_CHUNK_MEM_SIZE = 25
 DEFAULT_MAX_CONCURRENCY = 5
 DEFAULT_CONCURRENT_DOWNLOADS = 10
-TIKA_SUPPORTED_FILETYPES = [
-    ".txt",
-    ".py",
-    ".rst",
-    ".html",
-    ".markdown",
-    ".json",
-    ".xml",
-    ".csv",
-    ".md",
-    ".ppt",
-    ".rtf",
-    ".docx",
-    ".odt",
-    ".xls",
-    ".xlsx",
-    ".rb",
-    ".paper",
-    ".sh",
-    ".pptx",
-    ".pdf",
-    ".doc",
-]
+TIKA_SUPPORTED_FILETYPES = frozenset(
+    [
+        ".txt",
+        ".py",
+        ".rst",
+        ".html",
+        ".markdown",
+        ".json",
+        ".xml",
+        ".csv",
+        ".md",
+        ".ppt",
+        ".rtf",
+        ".docx",
+        ".odt",
+        ".xls",
+        ".xlsx",
+        ".rb",
+        ".paper",
+        ".sh",
+        ".pptx",
+        ".pdf",
+        ".doc",
+    ]
+)
 
 
 def iso_utc(when=None):